@@ -0,0 +1,130 @@
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from conllu import COLUMNS, download_split, iter_conllu
+from pos_tagging import TaggerPool, parse_tagged, redistribute_pos_tags_batch
+
+
+def measure(fn, *args):
+    '''
+    (result, seconds, peak MB of Python allocations) of fn(*args).
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def grouped_dataframe(path):
+    '''
+    The notebook's get_dataframe_of_split (on a local file) followed by the groupby.
+    '''
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    data = []
+    sentence_id = 0
+    for line in lines:
+        if line.startswith("# sent_id"):
+            sentence_id += 1
+        elif line.startswith("#") or line.strip() == "":
+            continue
+        else:
+            values = line.split('\t')
+            values.append(sentence_id)
+            data.append(values)
+    df = pd.DataFrame(data, columns=COLUMNS + ["SENTENCE_ID"])
+    df = df[["SENTENCE_ID", "ID", "FORM", "UPOS"]].rename(
+        columns={"SENTENCE_ID": "sentence_id", "ID": "id", "FORM": "word", "UPOS": "tag"})
+    return df.groupby(["sentence_id"])[["word", "tag"]].agg(list).reset_index()
+
+
+def count_streamed(path):
+    return sum(1 for _ in iter_conllu(path))
+
+
+def redistribute_pos_tags_loop(tagged_words):
+    '''
+    The notebook's redistribute_pos_tags, for comparison.
+    '''
+    i = 0
+    while i < len(tagged_words):
+        if tagged_words[i][1] == 'UNKNOWN':
+            j = i + 1
+            while j < len(tagged_words) and tagged_words[j][1] == 'UNKNOWN':
+                j += 1
+            if j < len(tagged_words):
+                combined_pos = tagged_words[j][1].split('+')
+                for k in range(i, j):
+                    if k - i < len(combined_pos) - 1:
+                        tagged_words[k] = (tagged_words[k][0], combined_pos[k - i])
+                    else:
+                        tagged_words[k] = (tagged_words[k][0], 'UNKNOWN')
+                tagged_words[j] = (tagged_words[j][0], combined_pos[-1])
+            i = j + 1
+        else:
+            i += 1
+    return tagged_words
+
+
+def benchmark_loading(path):
+    n, seconds, peak = measure(lambda: len(grouped_dataframe(path)))
+    print(f"pandas + groupby: {n / seconds:,.0f} sentences/s, peak {peak:.1f} MB")
+    n, seconds, peak = measure(count_streamed, path)
+    print(f"streaming reader: {n / seconds:,.0f} sentences/s, peak {peak:.1f} MB")
+
+
+def benchmark_tagging(sentences, pool_size, batch_size, per_call_n):
+    from farasa.pos import FarasaPOSTagger
+
+    start = time.perf_counter()
+    for sentence in sentences[:per_call_n]:
+        FarasaPOSTagger().tag(sentence)
+    print(f"new tagger per call: {per_call_n / (time.perf_counter() - start):.2f} sentences/s")
+
+    start = time.perf_counter()
+    with TaggerPool(pool_size, batch_size=batch_size) as pool:
+        print(f"pool start-up ({pool_size} taggers): {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        outputs = pool.tag_raw(sentences)
+        print(f"pool ({pool_size} warm taggers): {len(sentences) / (time.perf_counter() - start):.1f} sentences/s, "
+              f"{pool.stats()['fallback_batches']} batches tagged one by one")
+
+    tagged = [parse_tagged(output) for output in outputs]
+    start = time.perf_counter()
+    expected = [redistribute_pos_tags_loop(list(tagged_words)) for tagged_words in tagged]
+    print(f"redistribute, notebook loop: {len(tagged) / (time.perf_counter() - start):,.0f} sentences/s")
+    start = time.perf_counter()
+    redistributed = redistribute_pos_tags_batch(tagged)
+    print(f"redistribute, array version: {len(tagged) / (time.perf_counter() - start):,.0f} sentences/s "
+          f"(same tags: {redistributed == expected})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sentences/sec and peak memory of CoNLL-U loading and Farasa tagging.')
+    parser.add_argument('--split', default='train', help='Arabic-PADT split to load (downloaded once to --data-dir).')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--n', type=int, default=500, help='Sentences of the test split to tag.')
+    parser.add_argument('--per-call-n', type=int, default=5, help='Sentences tagged with a new tagger each.')
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    benchmark_loading(download_split(args.split, args.data_dir))
+
+    try:
+        import farasa  # noqa: F401
+    except ImportError:
+        print("farasapy is not installed, skipping the tagging benchmark")
+        return
+    sentences = [' '.join(sentence['text']) for _, sentence in zip(range(args.n), iter_conllu(download_split('test', args.data_dir)))]
+    benchmark_tagging(sentences, args.pool_size, args.batch_size, args.per_call_n)
+
+
+if __name__ == "__main__":
+    main()
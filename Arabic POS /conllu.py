@@ -0,0 +1,75 @@
+import csv
+import os
+
+import requests
+
+# Define the links of the dataset files
+DATASET_SPLITS = {
+    "train": "https://raw.githubusercontent.com/UniversalDependencies/UD_Arabic-PADT/master/ar_padt-ud-train.conllu",
+    "test": "https://raw.githubusercontent.com/UniversalDependencies/UD_Arabic-PADT/master/ar_padt-ud-test.conllu",
+    "dev": "https://raw.githubusercontent.com/UniversalDependencies/UD_Arabic-PADT/master/ar_padt-ud-dev.conllu",
+}
+
+# These are the standard column names for these `conllu` files
+COLUMNS = ["ID", "FORM", "LEMMA", "UPOS", "XPOS", "FEATS", "HEAD", "DEPREL", "DEPS", "MISC"]
+FORM, UPOS = COLUMNS.index("FORM"), COLUMNS.index("UPOS")
+
+
+def download_split(split, data_dir='.', chunk_size=1 << 20):
+    '''
+    Download a split of the treebank to data_dir once and return the local path.
+    The file is streamed to disk instead of being held in memory as one string.
+    '''
+    path = os.path.join(data_dir, os.path.basename(DATASET_SPLITS[split]))
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    with requests.get(DATASET_SPLITS[split], stream=True) as response:
+        response.raise_for_status()
+        with open(path + '.tmp', 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def iter_conllu(path):
+    '''
+    Yield {'sentence_id', 'text', 'tags'} for each sentence of a local CoNLL-U file,
+    reading it line by line. The sentences, words (FORM) and tags (UPOS) are the same
+    as the notebook's get_dataframe_of_split followed by the groupby on sentence_id:
+    a "# sent_id" comment starts a new sentence, other comments and blank lines are
+    skipped, and every remaining line (multiword tokens included) is a token.
+    '''
+    sentence_id, text, tags = 0, [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith("# sent_id"):
+                if text:
+                    yield {'sentence_id': sentence_id, 'text': text, 'tags': tags}
+                sentence_id, text, tags = sentence_id + 1, [], []
+            elif line.startswith("#") or line.strip() == "":
+                continue
+            else:
+                values = line.split('\t')
+                text.append(values[FORM] if len(values) > FORM else None)
+                tags.append(values[UPOS] if len(values) > UPOS else None)
+    if text:
+        yield {'sentence_id': sentence_id, 'text': text, 'tags': tags}
+
+
+def write_grouped_csv(sentences, out_path):
+    '''
+    Write sentences from iter_conllu to out_path in the layout of the notebook's
+    grouped_*_df.to_csv (sentence_id, text, tags, lists as their Python repr) and
+    return the number of sentences written.
+    '''
+    n_sentences = 0
+    with open(out_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['sentence_id', 'text', 'tags'])
+        for sentence in sentences:
+            writer.writerow([sentence['sentence_id'], str(sentence['text']), str(sentence['tags'])])
+            n_sentences += 1
+    return n_sentences
@@ -0,0 +1,166 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+UNKNOWN = 'UNKNOWN'
+DEFAULT_BATCH_SIZE = 64
+
+
+def parse_tagged(output):
+    '''
+    (word, pos) pairs of Farasa's "word/POS" output, as in the notebook: the tag after
+    the first '/', or UNKNOWN for segments without one (e.g. the "ال+" prefix).
+    '''
+    tagged_words = []
+    for token in output.split():
+        if '/' in token:
+            word, pos = token.split('/', 1)
+        else:
+            word, pos = token, UNKNOWN
+        tagged_words.append((word, pos))
+    return tagged_words
+
+
+def redistribute_pos_tags(tagged_words):
+    '''
+    The notebook's redistribute_pos_tags with array operations instead of the while
+    loops. A run of UNKNOWN segments takes, in order, the parts of the combined tag of
+    the next tagged segment ("DET+NOUN-MS" -> "DET", ...), extra segments stay UNKNOWN,
+    and the tagged segment keeps the last part. Returns a new list.
+
+    Only the runs and their tagged segments are rewritten, and each distinct combined
+    tag is split once.
+    '''
+    n = len(tagged_words)
+    unknown = np.fromiter((pos == UNKNOWN for _, pos in tagged_words), dtype=bool, count=n)
+    result = list(tagged_words)
+    if not unknown.any():
+        return result
+    positions = np.arange(n)
+    # Index of the first tagged segment at or after each position (n if none)
+    next_known = np.minimum.accumulate(np.where(unknown, n, positions)[::-1])[::-1]
+    # Start of the UNKNOWN run each position belongs to
+    run_start = np.maximum.accumulate(np.where(unknown & ~np.r_[False, unknown[:-1]], positions, 0))
+
+    # UNKNOWN segments with nothing tagged after them are left as they are
+    members = np.flatnonzero(unknown & (next_known < n))
+    targets = np.unique(next_known[members])
+    parts = {}
+    for pos in {tagged_words[j][1] for j in targets.tolist()}:
+        parts[pos] = pos.split('+')
+
+    for i, j, offset in zip(members.tolist(), next_known[members].tolist(), (members - run_start[members]).tolist()):
+        combined_pos = parts[tagged_words[j][1]]
+        result[i] = (tagged_words[i][0], combined_pos[offset] if offset < len(combined_pos) - 1 else UNKNOWN)
+    for j in targets.tolist():
+        result[j] = (tagged_words[j][0], parts[tagged_words[j][1]][-1])
+    return result
+
+
+def redistribute_pos_tags_batch(tagged_sentences):
+    '''
+    redistribute_pos_tags of every sentence in one pass over all their segments. Each
+    sentence is followed by a sentinel with an empty tag, so an UNKNOWN run at the end
+    of a sentence stays UNKNOWN instead of borrowing from the next sentence.
+    '''
+    sentinel = [('', '')]
+    redistributed = redistribute_pos_tags(list(itertools.chain.from_iterable(
+        itertools.chain.from_iterable((tagged_words, sentinel) for tagged_words in tagged_sentences))))
+    out, start = [], 0
+    for tagged_words in tagged_sentences:
+        out.append(redistributed[start:start + len(tagged_words)])
+        start += len(tagged_words) + 1
+    return out
+
+
+class TaggerPool:
+    '''
+    A fixed set of FarasaPOSTagger instances started once and reused, so the JVM
+    behind each one is launched at start-up rather than per call.
+
+    tag() cuts the sentences into batches of batch_size, hands each batch to a free
+    tagger and runs the batches on all taggers at once. An interactive tagger still
+    does one JVM round trip per line, so the gain comes from the warm JVMs working in
+    parallel; the batches only keep a tagger busy for many sentences at a time.
+    '''
+
+    def __init__(self, size=2, factory=None, batch_size=DEFAULT_BATCH_SIZE):
+        if factory is None:
+            from farasa.pos import FarasaPOSTagger
+
+            def factory():
+                return FarasaPOSTagger(interactive=True)
+
+        self.size = size
+        self.batch_size = batch_size
+        self._taggers = queue.Queue()
+        self._all = [factory() for _ in range(size)]
+        for tagger in self._all:
+            self._taggers.put(tagger)
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='farasa')
+        self._fallbacks = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        tagger = self._taggers.get()
+        try:
+            yield tagger
+        finally:
+            self._taggers.put(tagger)
+
+    def _tag_batch(self, sentences):
+        '''
+        Raw Farasa output of each sentence ('' for empty ones), the batch passed to the
+        tagger as newline-joined lines. Newlines inside a sentence would shift the lines,
+        so they are replaced by spaces, and empty sentences are left out since Farasa
+        drops empty output lines. If it still returns a different number of lines, the
+        batch is tagged sentence by sentence.
+        '''
+        sentences = [' '.join(sentence.split()) for sentence in sentences]
+        non_empty = [i for i, sentence in enumerate(sentences) if sentence]
+        outputs = [''] * len(sentences)
+        if not non_empty:
+            return outputs
+        with self.acquire() as tagger:
+            lines = [line for line in tagger.tag('\n'.join(sentences[i] for i in non_empty)).split('\n') if line.strip()]
+            if len(lines) != len(non_empty):
+                with self._lock:
+                    self._fallbacks += 1
+                lines = [tagger.tag(sentences[i]) for i in non_empty]
+        for i, line in zip(non_empty, lines):
+            outputs[i] = line
+        return outputs
+
+    def tag_raw(self, sentences):
+        batches = [sentences[start:start + self.batch_size] for start in range(0, len(sentences), self.batch_size)]
+        return [line for lines in self._executor.map(self._tag_batch, batches) for line in lines]
+
+    def tag(self, sentences, redistribute=True):
+        '''
+        [(word, pos), ...] for each sentence, with redistribute_pos_tags applied to all
+        of them in one pass.
+        '''
+        tagged = [parse_tagged(output) for output in self.tag_raw(list(sentences))]
+        return redistribute_pos_tags_batch(tagged) if redistribute else tagged
+
+    def stats(self):
+        return {'taggers': self.size, 'batch_size': self.batch_size, 'fallback_batches': self._fallbacks}
+
+    def close(self):
+        self._executor.shutdown()
+        for tagger in self._all:
+            terminate = getattr(tagger, 'terminate', None)
+            if terminate is not None:
+                terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dotenv import load_dotenv
+import threading
+import random
+import time
+import uuid
+import os
+
+from instrumentation import STAGE_SECONDS, count, stage
+from LLM import cache_key, get_model, get_model_name, get_rate_limiter, get_response_cache
+from Prompt import get_course_proposal_prompt
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def _retryable_errors():
+    '''
+    Errors worth retrying: timeouts, dropped connections and the API's 429 / 5xx errors.
+    '''
+    errors = (TimeoutError, ConnectionError)
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return errors
+    return errors + (exceptions.TooManyRequests, exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+                     exceptions.InternalServerError, exceptions.DeadlineExceeded)
+
+
+class Job:
+    '''
+    One submitted batch of courses: a future per course (or the error that kept the
+    course from being sent) and the time every course finished.
+    '''
+
+    def __init__(self, n_items):
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+        self.finished = None
+        self.items = [None] * n_items
+        self._pending = n_items
+        self._lock = threading.Lock()
+
+    def _item_done(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self.finished = time.time()
+
+    def status(self):
+        '''
+        The job's progress. Queued and running count generations: a pending course that
+        shares the generation of an earlier course in the job is counted as coalesced.
+        '''
+        counts = {'queued': 0, 'running': 0, 'coalesced': 0, 'completed': 0, 'failed': 0}
+        pending = set()
+        for item in self.items:
+            if item['future'] is None:
+                counts['failed'] += 1
+            elif not item['future'].done():
+                if item['future'] in pending:
+                    counts['coalesced'] += 1
+                else:
+                    pending.add(item['future'])
+                    counts['running' if item['future'].running() else 'queued'] += 1
+            elif item['future'].exception() is not None:
+                counts['failed'] += 1
+            else:
+                counts['completed'] += 1
+
+        if self.finished is None:
+            status = 'running' if counts['running'] or counts['completed'] or counts['failed'] else 'queued'
+        else:
+            status = 'failed' if counts['failed'] == len(self.items) else 'completed'
+        return {
+            'job_id': self.id,
+            'status': status,
+            'total': len(self.items),
+            **counts,
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+    def results(self):
+        results = []
+        for index, item in enumerate(self.items):
+            result = {'index': index, 'subject': item['subject']}
+            future = item['future']
+            if future is None:
+                result.update(status='failed', error=item['error'])
+            elif not future.done():
+                result.update(status='pending')
+            elif future.exception() is not None:
+                result.update(status='failed', error=str(future.exception()))
+            else:
+                proposal, cached = future.result()
+                result.update(status='completed', proposal=proposal, cached=cached)
+            results.append(result)
+        return results
+
+
+class JobQueue:
+    '''
+    Generates proposals for batches of courses in a bounded pool of worker threads.
+
+    - Calls to the model go through the provider's RateLimiter.
+    - Transient errors are retried up to max_retries times with exponential backoff
+      and jitter.
+    - Identical prompts share one in-flight generation (within a batch and across
+      jobs), and finished ones are served from the response cache.
+    '''
+
+    def __init__(self, max_workers=4, rate_per_minute=60, max_retries=3, backoff=1.0, max_jobs=1000,
+                 model=None, cache=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_jobs = max_jobs
+        self.rate_per_minute = rate_per_minute
+        self._model = model
+        self._cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='proposal-worker')
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self._retryable = _retryable_errors()
+
+    @property
+    def model(self):
+        return self._model or get_model()
+
+    @property
+    def cache(self):
+        return self._cache or get_response_cache()
+
+    def _generate(self, prompt):
+        '''
+        Return (proposal, cached) for one prompt, retrying transient model errors.
+        '''
+        model, cache = self.model, self.cache
+        model_name = get_model_name(model)
+        text = cache.get(prompt, model_name)
+        if text is not None:
+            count('response_cache_hit')
+            return text, True
+        count('response_cache_miss')
+
+        limiter = get_rate_limiter(model_name, self.rate_per_minute)
+        for attempt in range(self.max_retries + 1):
+            STAGE_SECONDS.observe(limiter.acquire(), stage='llm_rate_limit_wait')
+            try:
+                with stage('llm_generate'):
+                    text = model.generate_content(prompt).text
+                break
+            except self._retryable:
+                if attempt == self.max_retries:
+                    raise
+                count('llm_retry')
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        return cache.set(prompt, model_name, text), False
+
+    def _future(self, prompt):
+        '''
+        The future generating this prompt, shared with any identical prompt in flight.
+        '''
+        key = cache_key(prompt, get_model_name(self.model))
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, prompt)
+                self._inflight[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+            return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def submit(self, courses):
+        '''
+        Queue a batch of course details and return its job id.
+        '''
+        job = Job(len(courses))
+        for index, course_details in enumerate(courses):
+            subject = course_details.get('subject') if isinstance(course_details, dict) else None
+            try:
+                prompt = get_course_proposal_prompt(course_details)
+            except Exception as e:
+                job.items[index] = {'subject': subject, 'future': None, 'error': f"Invalid course details: {e!r}"}
+                job._item_done()
+                continue
+            future = self._future(prompt)
+            job.items[index] = {'subject': subject, 'future': future, 'error': None}
+            future.add_done_callback(job._item_done)
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job.id
+
+    def _prune(self):
+        '''
+        Forget the oldest finished jobs beyond max_jobs.
+        '''
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].finished is not None:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def set_job_queue(queue):
+    '''
+    Replace the shared job queue (e.g. with one using a FakeModel in tests).
+    '''
+    global _queue
+    with _queue_lock:
+        previous, _queue = _queue, queue
+    return previous
+
+
+def get_job_queue():
+    '''
+    Process-wide job queue, configured from the .env file:
+    JOB_WORKERS, LLM_RATE_PER_MINUTE, JOB_MAX_RETRIES and JOB_RETRY_BACKOFF (seconds).
+    '''
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                load_dotenv()
+                _queue = JobQueue(
+                    max_workers=int(os.getenv("JOB_WORKERS", 4)),
+                    rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", 60)),
+                    max_retries=int(os.getenv("JOB_MAX_RETRIES", 3)),
+                    backoff=float(os.getenv("JOB_RETRY_BACKOFF", 1.0)),
+                )
+    return _queue
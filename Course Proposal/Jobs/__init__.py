@@ -0,0 +1 @@
+from .Queue import Job, JobQueue, get_job_queue, set_job_queue
@@ -0,0 +1,165 @@
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+from instrumentation import count, stage
+from .Model import get_model, get_model_name
+
+
+DEFAULT_CACHE_PATH = "cache/responses.sqlite3"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_MB = 256
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_key(prompt, model_name):
+    '''
+    Hash of the model name and the rendered prompt.
+    '''
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    '''
+    Persistent cache of model responses in a local SQLite file.
+    Entries expire `ttl` seconds after they were written, and once the stored text grows
+    beyond `max_bytes` the least recently used entries are evicted.
+    The file can be shared by several worker processes.
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, prompt, model_name):
+        '''
+        Return the cached response text, or None if it is missing or expired.
+        '''
+        key = cache_key(prompt, model_name)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, prompt, model_name, response):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(prompt, model_name), model_name, response, size, now, now)
+            )
+            self._evict(conn, now)
+        return response
+
+    def _evict(self, conn, now):
+        '''
+        Drop expired entries, then the least recently used ones until under max_bytes.
+        '''
+        conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def get_response_cache():
+    '''
+    Process-wide response cache, configured from the .env file:
+    RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL (seconds) and RESPONSE_CACHE_MAX_MB.
+    '''
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                load_dotenv()
+                _cache = ResponseCache(
+                    path=os.getenv("RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    ttl=float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+                    max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+                )
+    return _cache
+
+
+def set_response_cache(cache):
+    '''
+    Replace the shared cache (e.g. with one in a temporary directory in tests).
+    '''
+    global _cache
+    with _cache_lock:
+        previous, _cache = _cache, cache
+    return previous
+
+
+def generate_cached(prompt, model=None, cache=None):
+    '''
+    Return (text, cached): the cached response for this prompt and model, or a fresh
+    one from the model, which is then stored.
+    '''
+    model = model or get_model()
+    cache = cache or get_response_cache()
+    model_name = get_model_name(model)
+    with stage('response_cache_get'):
+        text = cache.get(prompt, model_name)
+    if text is not None:
+        count('response_cache_hit')
+        return text, True
+    count('response_cache_miss')
+    with stage('llm_generate'):
+        text = model.generate_content(prompt).text
+    return cache.set(prompt, model_name, text), False
@@ -0,0 +1,89 @@
+import threading
+import hashlib
+import time
+
+
+class FakeTransientError(ConnectionError):
+    '''
+    Raised by FakeModel for its first `failures` calls, like a 429 / 503 from the API.
+    '''
+
+
+class FakeResponse:
+    '''
+    Mimics the `text` attribute of a Gemini response.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    '''
+    Mimics a streamed Gemini response: iterating yields chunks with a `text` attribute,
+    `chunk_delay` seconds apart. cancel() stops the stream like closing the connection.
+    '''
+
+    def __init__(self, model, chunks, chunk_delay):
+        self.model = model
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.cancelled = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if self.cancelled:
+                return
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            self.model.chunks_sent += 1
+            yield FakeResponse(chunk)
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.model.cancelled += 1
+
+
+class FakeModel:
+    '''
+    Offline stand-in for genai.GenerativeModel.
+    It returns a canned proposal (or `text`) after `delay` seconds and counts its calls,
+    so routes can be tested without an API key or quota. With stream=True the text is
+    sent in chunks of `chunk_size` words. The first `failures` calls raise
+    FakeTransientError to exercise retries.
+    '''
+
+    def __init__(self, text=None, delay=0.0, model_name="fake-model", chunk_size=5, chunk_delay=0.0, failures=0):
+        self.text = text
+        self.delay = delay
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.failures = failures
+        self.calls = 0
+        self.chunks_sent = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+
+    def _text(self, prompt):
+        if self.text is not None:
+            return self.text
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return f"**مقترح دورة تدريبية**\n\nمقترح تجريبي تم إنشاؤه بدون نموذج لغوي ({digest})."
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failing = self.calls <= self.failures
+        if self.delay:
+            time.sleep(self.delay)
+        if failing:
+            raise FakeTransientError("Fake model is temporarily unavailable.")
+        text = self._text(prompt)
+        if not stream:
+            return FakeResponse(text)
+        words = text.split(' ')
+        chunks = [' '.join(words[i:i + self.chunk_size]) for i in range(0, len(words), self.chunk_size)]
+        chunks = [chunk + ' ' for chunk in chunks[:-1]] + chunks[-1:]
+        return FakeStream(self, chunks, self.chunk_delay)
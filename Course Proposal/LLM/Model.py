@@ -1,16 +1,58 @@
-import google.generativeai as genai
 from dotenv import load_dotenv
+import threading
 import os
 
 
-def get_model():
+MODEL_NAME = "gemini-1.5-flash"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _create_model():
     '''
-    This function returns the model object that is used to generate the course proposals.
-    The default model is "gemini-1.5-flash"
-    The model is created using the API key that is stored in the .env file
+    Create the model client from the environment.
+    Setting LLM_PROVIDER=fake in the .env file uses the offline FakeModel instead of Gemini.
     '''
     load_dotenv()
+    if os.getenv("LLM_PROVIDER", "google") == "fake":
+        from .FakeModel import FakeModel
+        return FakeModel()
+
+    import google.generativeai as genai
     api_key = os.getenv("GOOGLE_API_KEY")
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    return model
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+def get_model():
+    '''
+    This function returns the model object that is used to generate the course proposals.
+    The default model is "gemini-1.5-flash"
+    The model is created using the API key that is stored in the .env file, once per
+    process, and the same client is shared by every request.
+    '''
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _create_model()
+    return _model
+
+
+def set_model(model):
+    '''
+    Replace the shared model (e.g. with a FakeModel in tests) and return the previous one.
+    Passing None makes the next get_model() call create the client again.
+    '''
+    global _model
+    with _model_lock:
+        previous, _model = _model, model
+    return previous
+
+
+def get_model_name(model):
+    '''
+    Name used to key cached responses, so answers of different models never mix.
+    '''
+    return getattr(model, 'model_name', MODEL_NAME)
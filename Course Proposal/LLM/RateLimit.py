@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    '''
+    Spaces calls to one provider at least 60 / rate_per_minute seconds apart, across
+    every thread of the process. A rate of 0 disables the limit.
+    '''
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Block until the next call is allowed. Returns the seconds waited.
+        '''
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next_call - now)
+            self._next_call = max(now, self._next_call) + self.interval
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def get_rate_limiter(provider, rate_per_minute):
+    '''
+    The shared limiter of a provider, created with rate_per_minute on first use.
+    '''
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = RateLimiter(rate_per_minute)
+        return limiter
@@ -0,0 +1,57 @@
+import time
+
+from instrumentation import STAGE_SECONDS, count, stage
+from .Cache import get_response_cache
+from .Model import get_model, get_model_name
+
+
+def cancel_stream(response):
+    '''
+    Stop a streamed generation nobody is reading any more, so it stops using quota.
+    google-generativeai keeps the underlying gRPC / REST stream in `_iterator`.
+    '''
+    for stream in (response, getattr(response, '_iterator', None)):
+        cancel = getattr(stream, 'cancel', None) or getattr(stream, 'close', None)
+        if cancel is not None:
+            cancel()
+            return
+
+
+def _generate_chunks(prompt, model, cache, model_name):
+    start = time.perf_counter()
+    response = model.generate_content(prompt, stream=True)
+    chunks = []
+    completed = False
+    try:
+        for chunk in response:
+            if not chunks:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage='llm_stream_first_chunk')
+            chunks.append(chunk.text)
+            yield chunk.text
+        completed = True
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='llm_stream')
+        if not completed:
+            count('llm_stream_cancelled')
+            cancel_stream(response)
+    # Only complete proposals are cached
+    cache.set(prompt, model_name, ''.join(chunks))
+
+
+def stream_cached(prompt, model=None, cache=None):
+    '''
+    Return (chunks, cached): an iterator over the response text and whether it came from
+    the cache. A cached proposal is a single chunk; otherwise the model streams it and
+    the full text is cached at the end.
+    Closing the iterator early (e.g. the client disconnected) cancels the generation.
+    '''
+    model = model or get_model()
+    cache = cache or get_response_cache()
+    model_name = get_model_name(model)
+    with stage('response_cache_get'):
+        text = cache.get(prompt, model_name)
+    if text is not None:
+        count('response_cache_hit')
+        return iter([text]), True
+    count('response_cache_miss')
+    return _generate_chunks(prompt, model, cache, model_name), False
@@ -1 +1,5 @@
-from .Model import get_model
+from .Model import get_model, set_model, get_model_name
+from .Cache import ResponseCache, cache_key, get_response_cache, set_response_cache, generate_cached
+from .Stream import stream_cached, cancel_stream
+from .RateLimit import RateLimiter, get_rate_limiter
+from .FakeModel import FakeModel, FakeTransientError
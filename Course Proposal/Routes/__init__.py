@@ -1,2 +1,3 @@
 from .proposal_routes import proposal_bp
+from .job_routes import job_bp
 from .base import base_bp
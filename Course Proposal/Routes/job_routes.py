@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify, url_for
+
+from Jobs import get_job_queue
+
+job_bp = Blueprint('jobs', __name__)
+
+
+@job_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    '''
+    Queue proposals for a batch of courses and return the job id right away.
+    The body is a list of course details, or {"courses": [...]}.
+    '''
+    try:
+        courses = request.json
+        if isinstance(courses, dict):
+            courses = courses.get('courses')
+        if not courses or not isinstance(courses, list):
+            return jsonify({'error': 'No courses provided.'}), 400
+        job_id = get_job_queue().submit(courses)
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('jobs.job_status', job_id=job_id),
+            'results_url': url_for('jobs.job_results', job_id=job_id),
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@job_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    '''
+    Progress of a job: how many courses are queued, running, completed and failed.
+    '''
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job.status()), 200
+
+
+@job_bp.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    '''
+    Proposals of a job, in submission order. Returns 202 while some are still pending.
+    '''
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    status = job.status()
+    return jsonify({**status, 'results': job.results()}), 200 if status['finished'] else 202
@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+import json
 
-from LLM import get_model
+from instrumentation import stage
+from LLM import generate_cached, stream_cached
 from Prompt import get_course_proposal_prompt
 
 proposal_bp = Blueprint('proposal', __name__)
@@ -15,11 +17,58 @@ def generate_course_proposal():
         course_details = request.json
         if not course_details:
             return jsonify({'error': 'No course details provided.'}), 400
-        prompt = get_course_proposal_prompt(course_details)
-        model = get_model()
-        proposal = model.generate_content(prompt)
-        return jsonify({
-            'proposal': proposal.text
-        }), 200
+        with stage('render_prompt'):
+            prompt = get_course_proposal_prompt(course_details)
+        proposal, cached = generate_cached(prompt)
+        response = jsonify({
+            'proposal': proposal
+        })
+        response.headers['X-Response-Cache'] = 'hit' if cached else 'miss'
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+
+def server_sent_event(event, data):
+    '''
+    Format one Server-Sent Event; the data is JSON so multi-line text stays in one event.
+    '''
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@proposal_bp.route('/proposal/stream', methods=['POST'])
+def stream_course_proposal():
+    '''
+    Stream a course proposal as Server-Sent Events: a "chunk" event per piece of text as
+    the model generates it, then "done" (or "error").
+    If the client disconnects, the server closes the generator and the model stream is
+    cancelled, so abandoned requests stop using quota.
+    '''
+    try:
+        course_details = request.json
+        if not course_details:
+            return jsonify({'error': 'No course details provided.'}), 400
+        with stage('render_prompt'):
+            prompt = get_course_proposal_prompt(course_details)
+        chunks, cached = stream_cached(prompt)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def events():
+        try:
+            for chunk in chunks:
+                yield server_sent_event('chunk', {'text': chunk})
+            yield server_sent_event('done', {'cached': cached})
+        except Exception as e:
+            yield server_sent_event('error', {'error': str(e)})
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'X-Response-Cache': 'hit' if cached else 'miss',
+    })
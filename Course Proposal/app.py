@@ -1,12 +1,19 @@
 from flask import Flask
-from Routes import proposal_bp, base_bp
+from Routes import proposal_bp, job_bp, base_bp
+from instrumentation import instrument_flask
+import os
 
 
 app = Flask(__name__)
 
+# Request latency, /metrics and the runtime profiler toggle
+instrument_flask(app)
+
 app.register_blueprint(base_bp, url_prefix='/')
 app.register_blueprint(proposal_bp, url_prefix='/text-generator')
+app.register_blueprint(job_bp, url_prefix='/text-generator')
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # LLM calls of /jobs run on the job queue's worker pool; debug mode is opt-in
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from LLM import FakeModel, ResponseCache, generate_cached
+
+
+class Clock:
+    '''
+    Stands in for time.time so entries can be aged without sleeping.
+    '''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / 'responses.sqlite3'), ttl=60, max_bytes=1000)
+
+
+def test_miss_then_hit(cache):
+    model = FakeModel()
+    text, cached = generate_cached('prompt', model, cache)
+    assert not cached
+    assert generate_cached('prompt', model, cache) == (text, True)
+    assert model.calls == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_keyed_on_prompt_and_model(cache):
+    generate_cached('prompt', FakeModel(), cache)
+    other_model = FakeModel(model_name='other-model')
+    assert not generate_cached('prompt', other_model, cache)[1]
+    assert not generate_cached('another prompt', other_model, cache)[1]
+    assert other_model.calls == 2
+
+
+def test_expired_entry_is_generated_again(cache, clock):
+    model = FakeModel()
+    generate_cached('prompt', model, cache)
+    clock.now += 59
+    assert generate_cached('prompt', model, cache)[1]
+    clock.now += 2
+    assert not generate_cached('prompt', model, cache)[1]
+    assert model.calls == 2
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    model = FakeModel(text='x' * 400)
+    for prompt in ['a', 'b']:
+        generate_cached(prompt, model, cache)
+        clock.now += 1
+    generate_cached('a', model, cache)  # 'b' is now the least recently used
+    clock.now += 1
+    generate_cached('c', model, cache)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.get('a', 'fake-model') is not None
+    assert cache.get('b', 'fake-model') is None
+    assert cache.get('c', 'fake-model') is not None
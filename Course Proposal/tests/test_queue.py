@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+
+from instrumentation import EVENTS
+from Jobs import JobQueue, Queue
+from LLM import FakeModel, RateLimiter, ResponseCache
+
+COURSE = {'subject': 'تحليل البيانات', 'training_method': 'عن بعد'}
+OTHER_COURSE = {'subject': 'أمن المعلومات', 'training_method': 'حضوري'}
+
+
+class GatedModel(FakeModel):
+    '''
+    FakeModel whose generations block until the test opens the gate.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def generate_content(self, prompt, **kwargs):
+        self.started.set()
+        self.gate.wait(5)
+        return super().generate_content(prompt, **kwargs)
+
+
+class Clock:
+    '''
+    Stands in for time.monotonic and time.sleep: sleeping advances the clock.
+    '''
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(time, 'sleep', clock.sleep)
+    monkeypatch.setattr(Queue.random, 'uniform', lambda low, high: 1.0)  # no jitter
+    return clock
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make_queue(model, **kwargs):
+        queue = JobQueue(max_workers=1, rate_per_minute=0, model=model,
+                         cache=ResponseCache(str(tmp_path / 'responses.sqlite3')), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make_queue
+    for queue in queues:
+        queue.shutdown()
+
+
+def finish(queue, job_id):
+    job = queue.get(job_id)
+    wait([item['future'] for item in job.items if item['future'] is not None])
+    return job
+
+
+def test_identical_courses_share_one_generation(make_queue):
+    model = GatedModel()
+    queue = make_queue(model)
+    job = queue.get(queue.submit([COURSE, COURSE, OTHER_COURSE]))
+    assert model.started.wait(5)
+
+    status = job.status()
+    assert (status['status'], status['total']) == ('running', 3)
+    assert (status['running'], status['queued'], status['coalesced']) == (1, 1, 1)
+    assert job.items[0]['future'] is job.items[1]['future']
+
+    # A later job joins the generation still in flight
+    other_job = queue.get(queue.submit([COURSE]))
+    assert other_job.items[0]['future'] is job.items[0]['future']
+
+    model.gate.set()
+    finish(queue, job.id)
+    finish(queue, other_job.id)
+    status = job.status()
+    assert (status['status'], status['completed'], status['coalesced']) == ('completed', 3, 0)
+    assert model.calls == 2
+
+    results = job.results()
+    assert results[0]['proposal'] == results[1]['proposal'] == other_job.results()[0]['proposal']
+
+
+def test_finished_proposals_come_from_the_cache(make_queue):
+    model = FakeModel()
+    queue = make_queue(model)
+    first = finish(queue, queue.submit([COURSE])).results()[0]
+    second = finish(queue, queue.submit([COURSE])).results()[0]
+    assert (first['cached'], second['cached']) == (False, True)
+    assert first['proposal'] == second['proposal']
+    assert model.calls == 1
+
+
+def test_transient_errors_are_retried_with_backoff(make_queue, clock):
+    model = FakeModel(failures=2)
+    queue = make_queue(model, max_retries=3, backoff=0.5)
+    retries = EVENTS.value(event='llm_retry')
+
+    result = finish(queue, queue.submit([COURSE])).results()[0]
+    assert result['status'] == 'completed'
+    assert model.calls == 3
+    assert clock.sleeps == [0.5, 1.0]
+    assert EVENTS.value(event='llm_retry') == retries + 2
+
+
+def test_gives_up_after_max_retries(make_queue, clock):
+    model = FakeModel(failures=5)
+    queue = make_queue(model, max_retries=1, backoff=0.5)
+    job = finish(queue, queue.submit([COURSE]))
+    assert job.status()['status'] == 'failed'
+    assert job.results()[0]['error'] == 'Fake model is temporarily unavailable.'
+    assert model.calls == 2
+
+
+def test_invalid_course_fails_without_a_call(make_queue):
+    model = FakeModel()
+    queue = make_queue(model)
+    job = finish(queue, queue.submit([{'subject': 'بدون طريقة تدريب'}, COURSE]))
+    status = job.status()
+    assert (status['failed'], status['completed']) == (1, 1)
+    assert job.results()[0]['error'].startswith('Invalid course details')
+    assert model.calls == 1
+
+
+def test_rate_limiter_spaces_calls(clock):
+    limiter = RateLimiter(rate_per_minute=120)
+    calls = []
+    for _ in range(3):
+        limiter.acquire()
+        calls.append(clock.now)
+    assert calls == [100.0, 100.5, 101.0]
+
+    clock.now += 10  # idle time is not saved up for a burst
+    assert [limiter.acquire() for _ in range(2)] == [0.0, 0.5]
+
+
+def test_rate_limiter_spaces_concurrent_calls(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(time, 'sleep', clock.sleeps.append)  # every caller asks at the same instant
+    limiter = RateLimiter(rate_per_minute=120)
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(clock.sleeps) == [0.5, 1.0, 1.5]
+
+
+def test_rate_limiter_disabled_at_zero(clock):
+    limiter = RateLimiter(rate_per_minute=0)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert clock.sleeps == []
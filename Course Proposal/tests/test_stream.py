@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from flask import Flask
+
+from LLM import FakeModel, ResponseCache, set_model, set_response_cache
+from Routes import proposal_bp
+
+COURSE = {'subject': 'تحليل البيانات', 'training_method': 'عن بعد'}
+
+
+@pytest.fixture
+def model(tmp_path):
+    model = FakeModel(chunk_size=3)
+    previous_model = set_model(model)
+    previous_cache = set_response_cache(ResponseCache(str(tmp_path / 'responses.sqlite3')))
+    yield model
+    set_model(previous_model)
+    set_response_cache(previous_cache)
+
+
+@pytest.fixture
+def client():
+    # The blueprint as app.py mounts it (importing app.py would clash with other services' app modules)
+    app = Flask(__name__)
+    app.register_blueprint(proposal_bp, url_prefix='/text-generator')
+    return app.test_client()
+
+
+def parse_events(body):
+    '''
+    [(event, data)] of a text/event-stream body.
+    '''
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def stream(client):
+    return client.post('/text-generator/proposal/stream', json=COURSE)
+
+
+def test_stream_sends_chunks_then_done(client, model):
+    response = stream(client)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['X-Response-Cache'] == 'miss'
+
+    events = parse_events(response.get_data(as_text=True))
+    assert [event for event, _ in events] == ['chunk'] * (len(events) - 1) + ['done']
+    assert len(events) > 2
+    assert events[-1][1] == {'cached': False}
+    assert model.chunks_sent == len(events) - 1
+
+    proposal = ''.join(data['text'] for _, data in events[:-1])
+    assert proposal == client.post('/text-generator/proposal', json=COURSE).get_json()['proposal']
+
+
+def test_completed_stream_is_cached(client, model):
+    first = parse_events(stream(client).get_data(as_text=True))
+    response = stream(client)
+    assert response.headers['X-Response-Cache'] == 'hit'
+    events = parse_events(response.get_data(as_text=True))
+    assert events == [('chunk', {'text': ''.join(data['text'] for _, data in first[:-1])}), ('done', {'cached': True})]
+    assert model.calls == 1
+
+
+def test_disconnect_cancels_generation(client, model):
+    response = client.post('/text-generator/proposal/stream', json=COURSE, buffered=False)
+    body = iter(response.response)
+    assert next(body).startswith(b'event: chunk')
+    response.close()  # what the server does when the client goes away
+
+    assert model.cancelled == 1
+    assert model.chunks_sent == 1
+    # The partial proposal is not cached: the next request generates it again
+    assert stream(client).headers['X-Response-Cache'] == 'miss'
+    assert model.calls == 2
+
+
+def test_model_error_is_sent_as_event(client, model):
+    model.failures = 1
+    events = parse_events(stream(client).get_data(as_text=True))
+    assert events == [('error', {'error': 'Fake model is temporarily unavailable.'})]
@@ -0,0 +1,270 @@
+import itertools
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+from embedding_index import DEFAULT_MODEL, EmbeddingIndex, load_embedder, normalize, text_hashes
+
+DEFAULT_CACHE_SIZE = 200000
+DEFAULT_CHUNK_SIZE = 256
+
+
+class PhraseEmbeddingCache:
+    '''
+    Normalized embeddings of candidate phrases, least recently used evicted beyond
+    max_items. get() embeds all the misses of a call in one batch.
+    '''
+
+    def __init__(self, embedder, max_items=DEFAULT_CACHE_SIZE, batch_size=256):
+        self.embedder = embedder
+        self.max_items = max_items
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def get(self, phrases):
+        '''
+        (len(phrases), dim) matrix of the phrase embeddings.
+        '''
+        missing = [phrase for phrase in dict.fromkeys(phrases) if phrase not in self._vectors]
+        self.misses += len(missing)
+        self.hits += len(phrases) - len(missing)
+        new = {}
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            new.update(zip(batch, normalize(self.embedder.embed(batch))))
+
+        rows = []
+        for phrase in phrases:
+            vector = new.get(phrase)
+            if vector is None:
+                vector = self._vectors[phrase]
+                self._vectors.move_to_end(phrase)
+            rows.append(vector)
+        for phrase, vector in new.items():
+            self._vectors[phrase] = vector
+        while len(self._vectors) > self.max_items:
+            self._vectors.popitem(last=False)
+        return np.stack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def mmr(doc_embedding, word_embeddings, words, top_n=5, diversity=0.8):
+    '''
+    KeyBERT's Maximal Marginal Relevance on normalized embeddings, with the same picks.
+    Instead of the full word-word similarity matrix, each step computes the similarity
+    to the last pick only and keeps a running max per candidate.
+    '''
+    if not len(words):
+        return []
+    word_doc_similarity = word_embeddings @ doc_embedding
+    selected = [int(np.argmax(word_doc_similarity))]
+    max_similarity = np.full(len(words), -np.inf, dtype=np.float32)
+    available = np.ones(len(words), dtype=bool)
+    available[selected[0]] = False
+    for _ in range(min(top_n - 1, len(words) - 1)):
+        max_similarity = np.maximum(max_similarity, word_embeddings @ word_embeddings[selected[-1]])
+        scores = (1 - diversity) * word_doc_similarity - diversity * max_similarity
+        scores[~available] = -np.inf
+        selected.append(int(np.argmax(scores)))
+        available[selected[-1]] = False
+    keywords = [(words[i], round(float(word_doc_similarity[i]), 4)) for i in selected]
+    return sorted(keywords, key=lambda keyword: keyword[1], reverse=True)
+
+
+def max_sum_distance(doc_embedding, word_embeddings, words, top_n=5, nr_candidates=20, block_size=65536):
+    '''
+    KeyBERT's Max Sum Distance: the top_n of the nr_candidates most similar words that
+    are least similar to each other. All combinations are scored as arrays, block_size
+    at a time, instead of one Python sum per combination.
+    '''
+    if nr_candidates < top_n:
+        raise ValueError("Make sure that the number of candidates exceeds the number of keywords to return.")
+    if top_n > len(words):
+        return []
+    distances = word_embeddings @ doc_embedding
+    words_idx = distances.argsort()[-nr_candidates:]
+    candidates = word_embeddings[words_idx] @ word_embeddings[words_idx].T
+    np.fill_diagonal(candidates, 0)
+
+    best, best_sum = None, np.inf
+    combinations = itertools.combinations(range(len(words_idx)), top_n)
+    while True:
+        block = np.fromiter(itertools.chain.from_iterable(itertools.islice(combinations, block_size)), dtype=np.int64)
+        if not len(block):
+            break
+        block = block.reshape(-1, top_n)
+        sums = candidates[block[:, :, None], block[:, None, :]].sum(axis=(1, 2))
+        i = int(np.argmin(sums))
+        if sums[i] < best_sum:
+            best, best_sum = block[i], sums[i]
+    return [(words[words_idx[i]], round(float(distances[words_idx[i]]), 4)) for i in best]
+
+
+class KeywordExtractor:
+    '''
+    extract_keywords_from_article for many articles at once, with KeyBERT's candidates
+    (CountVectorizer n-grams) and scores.
+
+    The document embeddings come from the EmbeddingIndex when it was built from the
+    same column (and model) and holds the article id with the same text, and the
+    candidate phrases from a PhraseEmbeddingCache, so a phrase that repeats across
+    articles is embedded once.
+    '''
+
+    def __init__(self, embedder, index=None, column='cleaned_Text', keyphrase_ngram_range=(1, 2), stop_words='english',
+                 top_n=10, use_mmr=True, diversity=0.7, nr_candidates=20, cache_size=DEFAULT_CACHE_SIZE):
+        self.embedder = embedder
+        # An index of another column holds embeddings of other texts
+        self.index = index if index is not None and index.manifest['column'] == column else None
+        self.keyphrase_ngram_range = keyphrase_ngram_range
+        self.stop_words = stop_words
+        self.top_n = top_n
+        self.use_mmr = use_mmr
+        self.diversity = diversity
+        self.nr_candidates = nr_candidates
+        self.cache = PhraseEmbeddingCache(embedder, cache_size)
+        self.doc_embeddings_reused = 0
+        self._index_rows = None
+        if self.index is not None:
+            ids = np.asarray(self.index.ids)
+            self._index_rows = pd.Series(np.arange(len(ids)), index=ids)
+            self._index_rows = self._index_rows[~self._index_rows.index.duplicated(keep='last')]
+
+    def doc_embeddings(self, ids, texts):
+        rows = np.full(len(texts), -1, dtype=np.int64)
+        if self._index_rows is not None:
+            rows = self._index_rows.reindex(ids).fillna(-1).to_numpy(dtype=np.int64)
+            # An article edited since it was indexed is embedded again
+            found = rows >= 0
+            found[found] = self.index.hashes[rows[found]] == text_hashes([texts[i] for i in np.flatnonzero(found)])
+            rows = np.where(found, rows, -1)
+        reused = rows >= 0
+        self.doc_embeddings_reused += int(reused.sum())
+
+        parts = {}
+        if reused.any():
+            parts[True] = np.asarray(self.index.vectors[rows[reused]], dtype=np.float32)
+        if not reused.all():
+            parts[False] = normalize(self.embedder.embed([text for text, found in zip(texts, reused) if not found]))
+        embeddings = np.empty((len(texts), next(iter(parts.values())).shape[1]), dtype=np.float32)
+        for found, part in parts.items():
+            embeddings[reused == found] = part
+        return embeddings
+
+    def extract(self, ids, texts):
+        '''
+        [(keyword, score), ...] per article; empty articles get [].
+        '''
+        results = [[] for _ in texts]
+        keep = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+        if not keep:
+            return results
+        texts = [texts[i] for i in keep]
+        try:
+            vectorizer = CountVectorizer(ngram_range=self.keyphrase_ngram_range, stop_words=self.stop_words)
+            counts = vectorizer.fit_transform(texts).tocsr()
+        except ValueError:
+            # Only stop words: KeyBERT returns nothing either
+            return results
+        words = vectorizer.get_feature_names_out()
+
+        doc_embeddings = self.doc_embeddings(np.asarray(ids)[keep], texts)
+        # Embed (or fetch) every candidate of the chunk in one call
+        used = np.unique(counts.indices)
+        word_embeddings = np.empty((len(words), doc_embeddings.shape[1]), dtype=np.float32)
+        word_embeddings[used] = self.cache.get(words[used].tolist())
+
+        for row, i in enumerate(keep):
+            candidates = counts.indices[counts.indptr[row]:counts.indptr[row + 1]]
+            candidates = np.sort(candidates)
+            if self.use_mmr:
+                results[i] = mmr(doc_embeddings[row], word_embeddings[candidates], words[candidates], self.top_n, self.diversity)
+            else:
+                results[i] = max_sum_distance(doc_embeddings[row], word_embeddings[candidates], words[candidates],
+                                              self.top_n, self.nr_candidates)
+        return results
+
+
+_extractor = None
+
+
+def _init_worker(model_name, index_path, column, options, threads):
+    global _extractor
+    # One intra-op thread per worker unless asked otherwise, so the workers do not oversubscribe the cores
+    if threads:
+        try:
+            import torch
+        except ImportError:
+            pass
+        else:
+            torch.set_num_threads(threads)
+    index = EmbeddingIndex(index_path) if index_path else None
+    _extractor = KeywordExtractor(load_embedder(model_name), index, column, **options)
+
+
+def _extract_chunk(chunk):
+    '''
+    Keyword rows of one chunk of (ids, texts), plus the worker's running counters.
+    '''
+    ids, texts = chunk
+    rows = [
+        {'article_idx': article_id, 'keyword': keyword, 'keyword_score': score}
+        for article_id, keywords in zip(ids, _extractor.extract(ids, texts))
+        for keyword, score in keywords
+    ]
+    return len(ids), rows, os.getpid(), {**_extractor.cache.stats(), 'doc_embeddings_reused': _extractor.doc_embeddings_reused}
+
+
+def extract_corpus(df, out_path, column='cleaned_Text', model_name=DEFAULT_MODEL, index_path=None, n_jobs=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, threads_per_worker=1, **options):
+    '''
+    Extract the keywords of every article of df[column] and stream them to out_path
+    (CSV with article_idx, keyword and keyword_score), chunk by chunk in df order.
+
+    Chunks are spread over n_jobs worker processes (default: all cores), each with its
+    own model, phrase cache and memory-mapped view of the index at index_path (used
+    only if it was built from the same column). Prints
+    the articles/sec and cache hit rate as chunks complete and returns the final counts.
+    '''
+    n_jobs = n_jobs or os.cpu_count()
+    ids, texts = df.index.to_numpy(), df[column].tolist()
+    chunks = [(ids[start:start + chunk_size], texts[start:start + chunk_size]) for start in range(0, len(texts), chunk_size)]
+
+    start = time.perf_counter()
+    worker_stats = {}
+    n_articles = n_keywords = hits = lookups = 0
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(model_name, index_path, column, options, threads_per_worker)) as executor:
+        for i, (n_chunk, rows, pid, stats) in enumerate(executor.map(_extract_chunk, chunks)):
+            pd.DataFrame(rows, columns=['article_idx', 'keyword', 'keyword_score']).to_csv(
+                out_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            worker_stats[pid] = stats
+            n_articles += n_chunk
+            n_keywords += len(rows)
+            hits = sum(stats['hits'] for stats in worker_stats.values())
+            lookups = hits + sum(stats['misses'] for stats in worker_stats.values())
+            print(f"{n_articles}/{len(texts)} articles, {n_articles / (time.perf_counter() - start):.1f} articles/s, "
+                  f"phrase cache hit rate {hits / lookups if lookups else 0.0:.1%}")
+
+    elapsed = time.perf_counter() - start
+    return {
+        'articles': n_articles,
+        'keywords': n_keywords,
+        'seconds': elapsed,
+        'articles_per_second': n_articles / elapsed,
+        'cache_hit_rate': hits / lookups if lookups else 0.0,
+        'doc_embeddings_reused': sum(stats['doc_embeddings_reused'] for stats in worker_stats.values()),
+    }
@@ -0,0 +1,46 @@
+import argparse
+import time
+
+import pandas as pd
+
+from embedding_index import (DEFAULT_INDEX_DIR, DEFAULT_MODEL, EmbeddingIndex, add_articles, build_index,
+                             load_embedder)
+
+
+def read_articles(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path, index_col=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed the articles once into a memory-mapped index for semantic search.')
+    parser.add_argument('input', help="Parquet or CSV of the articles (e.g. df.to_parquet('articles.parquet') in the notebook).")
+    parser.add_argument('--column', default='cleaned_Text')
+    parser.add_argument('--out', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--add', action='store_true', help='Append the articles not indexed yet instead of rebuilding; ids already indexed must hold the same text.')
+    parser.add_argument('--ivf-lists', type=int, default=0, help='Train a coarse quantizer with this many lists.')
+    args = parser.parse_args()
+
+    df = read_articles(args.input)
+    embedder = load_embedder(args.model)
+
+    start = time.perf_counter()
+    if args.add:
+        index = EmbeddingIndex(args.out, writable=True)
+        n_added = add_articles(index, embedder, df[args.column].tolist(), df.index.to_numpy(), args.column,
+                               args.batch_size)
+    else:
+        index = build_index(df, embedder, args.out, args.column, args.dtype, args.model, args.batch_size)
+        n_added = len(index)
+    print(f"Embedded {n_added} articles in {time.perf_counter() - start:.1f}s; '{args.out}' holds {len(index)}")
+
+    if args.ivf_lists:
+        start = time.perf_counter()
+        index.train_ivf(args.ivf_lists)
+        print(f"Trained {args.ivf_lists} IVF lists in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Bump this whenever the on-disk layout changes
+INDEX_VERSION = 2
+
+DEFAULT_INDEX_DIR = 'embedding_index'
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'  # KeyBERT's default sentence-transformers model
+DEFAULT_BLOCK_SIZE = 65536
+DTYPES = {'float32': np.float32, 'float16': np.float16}
+
+
+def load_embedder(model_name=DEFAULT_MODEL):
+    '''
+    The embedding backend of KeyBERT (kw_model.model), whose embed() the notebook calls.
+    '''
+    from keybert import KeyBERT
+    return KeyBERT(model_name).model
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _texts(texts):
+    '''
+    Missing or blank texts are embedded as "", as in improved_semantic_search.
+    '''
+    return [text if isinstance(text, str) and text.strip() else "" for text in texts]
+
+
+def text_hashes(texts):
+    '''
+    64-bit hash of each text (as embedded), stored with its row to tell whether an
+    article id still holds the same text.
+    '''
+    return np.array([
+        int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little') for text in _texts(texts)
+    ], dtype=np.uint64)
+
+
+def _top_k(scores, k):
+    '''
+    Positions of the k highest scores of each row, best first.
+    '''
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+class EmbeddingIndex:
+    '''
+    Normalized article embeddings in a memory-mapped .npy file, with the article id and
+    text hash of each row. The manifest records the DataFrame column the texts came
+    from. Searching is a matrix-vector product over blocks of block_size rows, so
+    the cosine similarity with the whole corpus never needs it all in memory.
+
+    Files are allocated with spare capacity, so add() appends in place and only
+    reallocates when the capacity doubles. The manifest holds the row count and is
+    written last, so readers never see half-added rows.
+
+    With train_ivf(), every row is also assigned to its nearest of n_lists centroids,
+    and search(nprobe=...) only scores the rows of the nprobe closest lists.
+    '''
+
+    def __init__(self, path=DEFAULT_INDEX_DIR, writable=False):
+        self.path = path
+        self.manifest = self._read_manifest(path)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No embedding index in '{path}'")
+        if self.manifest['version'] != INDEX_VERSION:
+            raise ValueError(f"Index in '{path}' has version {self.manifest['version']}, expected {INDEX_VERSION}")
+        self.writable = writable
+        self._open()
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def create(cls, path=DEFAULT_INDEX_DIR, dim=384, dtype='float32', model=DEFAULT_MODEL, column='cleaned_Text',
+               capacity=1024):
+        '''
+        An empty index; anything already in `path` is replaced.
+        '''
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {list(DTYPES)}")
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for name in ('ivf_centroids.npy', 'ivf_lists.npy'):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        manifest = {'version': INDEX_VERSION, 'model': model, 'column': column, 'dim': dim, 'dtype': dtype, 'count': 0,
+                    'capacity': capacity}
+        cls._allocate(path, manifest, capacity)
+        cls._write_manifest(path, manifest)
+        return cls(path, writable=True)
+
+    @staticmethod
+    def _allocate(path, manifest, capacity):
+        shapes = {'vectors': ((capacity, manifest['dim']), DTYPES[manifest['dtype']]), 'ids': ((capacity,), np.int64),
+                  'hashes': ((capacity,), np.uint64)}
+        for name, (shape, dtype) in shapes.items():
+            np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape).flush()
+
+    @staticmethod
+    def _write_manifest(path, manifest):
+        tmp_path = os.path.join(path, 'manifest.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(path, 'manifest.json'))
+
+    def _open(self):
+        mode = 'r+' if self.writable else 'r'
+        self._vectors = np.load(os.path.join(self.path, 'vectors.npy'), mmap_mode=mode)
+        self._ids = np.load(os.path.join(self.path, 'ids.npy'), mmap_mode=mode)
+        self._hashes = np.load(os.path.join(self.path, 'hashes.npy'), mmap_mode=mode)
+        centroids_path = os.path.join(self.path, 'ivf_centroids.npy')
+        if os.path.exists(centroids_path):
+            self.centroids = np.load(centroids_path)
+            self._lists = np.load(os.path.join(self.path, 'ivf_lists.npy'), mmap_mode=mode)
+        else:
+            self.centroids, self._lists = None, None
+        self._list_rows = None
+        self._id_rows = None
+
+    def __len__(self):
+        return self.manifest['count']
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self)]
+
+    @property
+    def ids(self):
+        return self._ids[:len(self)]
+
+    @property
+    def hashes(self):
+        return self._hashes[:len(self)]
+
+    def hashes_of(self, ids):
+        '''
+        The text hash stored for each article id, 0 for ids that are not indexed.
+        '''
+        if self._id_rows is None:
+            order = np.argsort(self.ids, kind='stable')
+            self._id_rows = np.asarray(self.ids)[order], order
+        sorted_ids, order = self._id_rows
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, ids)
+        found = positions < len(sorted_ids)
+        found[found] = sorted_ids[positions[found]] == ids[found]
+        hashes = np.zeros(len(ids), dtype=np.uint64)
+        hashes[found] = self._hashes[order[positions[found]]]
+        return hashes
+
+    def _grow(self, needed):
+        capacity = self.manifest['capacity']
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.manifest['capacity']:
+            return
+        count = len(self)
+        arrays = {'vectors': self._vectors, 'ids': self._ids, 'hashes': self._hashes}
+        if self._lists is not None:
+            arrays['ivf_lists'] = self._lists
+        for name, array in arrays.items():
+            tmp_path = os.path.join(self.path, name + '.tmp.npy')
+            grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=array.dtype, shape=(capacity,) + array.shape[1:])
+            grown[:count] = array[:count]
+            grown.flush()
+            del grown
+            os.replace(tmp_path, os.path.join(self.path, name + '.npy'))
+        self.manifest['capacity'] = capacity
+        self._open()
+
+    def add(self, vectors, ids, hashes):
+        '''
+        Append embeddings (normalized here) with their article ids and text_hashes.
+        '''
+        if not self.writable:
+            raise PermissionError("Open the index with writable=True to add vectors")
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if vectors.shape[1] != self.manifest['dim'] or len(vectors) != len(ids) or len(ids) != len(hashes):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.manifest['dim']} and {len(ids)} hashes, "
+                             f"got {vectors.shape} and {hashes.shape}")
+
+        start, stop = len(self), len(self) + len(vectors)
+        self._grow(stop)
+        self._vectors[start:stop] = vectors
+        self._ids[start:stop] = ids
+        self._hashes[start:stop] = hashes
+        self._vectors.flush()
+        self._ids.flush()
+        self._hashes.flush()
+        self._id_rows = None
+        if self.centroids is not None:
+            self._lists[start:stop] = self._assign(vectors)
+            self._lists.flush()
+            self._list_rows = None
+        self.manifest['count'] = stop
+        self._write_manifest(self.path, self.manifest)
+
+    def _assign(self, vectors, block_size=DEFAULT_BLOCK_SIZE):
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            lists[start:start + block_size] = (block @ self.centroids.T).argmax(axis=1)
+        return lists
+
+    def train_ivf(self, n_lists, sample_size=100000, seed=42, block_size=DEFAULT_BLOCK_SIZE):
+        '''
+        Cluster a sample of the vectors into n_lists (spherical k-means centroids) and
+        assign every row to its nearest centroid. Rows added later are assigned on add().
+        '''
+        from sklearn.cluster import MiniBatchKMeans
+
+        if not self.writable:
+            raise PermissionError("Open the index with writable=True to train the coarse quantizer")
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(self), size=min(sample_size, len(self)), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, batch_size=4096, n_init=3)
+        kmeans.fit(np.asarray(self.vectors[sample], dtype=np.float32))
+
+        self.centroids = normalize(kmeans.cluster_centers_)
+        np.save(os.path.join(self.path, 'ivf_centroids.npy'), self.centroids)
+        lists = np.lib.format.open_memmap(os.path.join(self.path, 'ivf_lists.npy'), mode='w+', dtype=np.int32,
+                                          shape=(self.manifest['capacity'],))
+        lists[:len(self)] = self._assign(self.vectors, block_size)
+        lists.flush()
+        self.manifest['n_lists'] = n_lists
+        self._write_manifest(self.path, self.manifest)
+        self._open()
+
+    def _rows_of_lists(self):
+        '''
+        (rows sorted by list, offsets) so the rows of list i are rows[offsets[i]:offsets[i + 1]].
+        '''
+        if self._list_rows is None:
+            lists = np.asarray(self._lists[:len(self)])
+            rows = np.argsort(lists, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(self.centroids)))])
+            self._list_rows = rows, offsets
+        return self._list_rows
+
+    def _scan(self, queries, rows, k, block_size):
+        '''
+        Top k (scores, rows) of the queries against the given rows (None: all rows).
+        '''
+        n_rows = len(self) if rows is None else len(rows)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, n_rows, block_size):
+            if rows is None:
+                block_rows = np.arange(start, min(start + block_size, n_rows))
+                block = self._vectors[start:start + len(block_rows)]
+            else:
+                block_rows = rows[start:start + block_size]
+                block = self._vectors[block_rows]
+            scores = np.concatenate([best_scores, queries @ np.asarray(block, dtype=np.float32).T], axis=1)
+            candidates = np.concatenate([best_rows, np.broadcast_to(block_rows, (len(queries), len(block_rows)))], axis=1)
+            top = _top_k(scores, k)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(candidates, top, axis=1)
+        return best_scores, best_rows
+
+    def search(self, query_vectors, k=30, nprobe=None, block_size=DEFAULT_BLOCK_SIZE):
+        '''
+        (similarities, ids) of the k most similar articles, best first, for one query
+        vector or each row of a query matrix. With nprobe and a trained quantizer, only
+        the rows of the nprobe closest lists are scored; when those lists hold fewer
+        than k rows, the remaining columns are padded with -inf similarities and id -1.
+        '''
+        single = np.ndim(query_vectors) == 1
+        queries = normalize(query_vectors)
+        if len(self) == 0:
+            empty = np.empty((len(queries), 0), dtype=np.float32)
+            return (empty[0], empty[0].astype(np.int64)) if single else (empty, empty.astype(np.int64))
+
+        if nprobe is None or self.centroids is None:
+            scores, rows = self._scan(queries, None, k, block_size)
+        else:
+            list_rows, offsets = self._rows_of_lists()
+            probes = _top_k(queries @ self.centroids.T, nprobe)
+            results = []
+            for query, lists in zip(queries, probes):
+                candidates = np.sort(np.concatenate([list_rows[offsets[i]:offsets[i + 1]] for i in lists]))
+                results.append(self._scan(query[None], candidates, k, block_size))
+            width = min(k, len(self))
+            scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+            rows = np.full((len(queries), width), -1, dtype=np.int64)
+            for i, (query_scores, query_rows) in enumerate(results):
+                scores[i, :query_scores.shape[1]] = query_scores[0]
+                rows[i, :query_rows.shape[1]] = query_rows[0]
+
+        ids = np.where(rows >= 0, self._ids[np.maximum(rows, 0)], -1)
+        return (scores[0], ids[0]) if single else (scores, ids)
+
+
+def embed_texts(embedder, texts, batch_size=32):
+    '''
+    Embed texts in batches with embedder.embed (the KeyBERT backend), as float32.
+    '''
+    texts = _texts(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate([
+        np.asarray(embedder.embed(texts[start:start + batch_size]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size)
+    ])
+
+
+def add_articles(index, embedder, texts, ids, column=None, batch_size=32, chunk_size=4096):
+    '''
+    Embed and append articles chunk by chunk, skipping ids that are already indexed with
+    the same text. Returns the number of articles added.
+
+    Raises ValueError, before embedding anything, if column is not the column the index
+    was built from or an id is already indexed with another text (e.g. new articles
+    whose index restarts at 0): give the new articles ids that are not in the index.
+    '''
+    if column is not None and column != index.manifest['column']:
+        raise ValueError(f"Index in '{index.path}' holds column '{index.manifest['column']}', not '{column}'")
+    ids = np.asarray(ids, dtype=np.int64)
+    hashes = text_hashes(texts)
+    indexed = index.hashes_of(ids)
+    new = ~np.isin(ids, index.ids)
+    changed = ~new & (indexed != hashes)
+    if changed.any():
+        raise ValueError(f"{int(changed.sum())} article ids are already indexed with another text "
+                         f"(first: {ids[changed][:5].tolist()}); rebuild the index or use unused ids")
+    texts = [text for text, keep in zip(texts, new) if keep]
+    ids, hashes = ids[new], hashes[new]
+    for start in range(0, len(ids), chunk_size):
+        index.add(embed_texts(embedder, texts[start:start + chunk_size], batch_size), ids[start:start + chunk_size],
+                  hashes[start:start + chunk_size])
+    return len(ids)
+
+
+def build_index(df, embedder, path=DEFAULT_INDEX_DIR, column='cleaned_Text', dtype='float32', model=DEFAULT_MODEL,
+                batch_size=32):
+    '''
+    Embed every article of df[column] once and store it under its df index.
+    '''
+    dim = len(embedder.embed(["test"])[0])
+    index = EmbeddingIndex.create(path, dim, dtype, model, column, capacity=max(len(df), 1024))
+    add_articles(index, embedder, df[column].tolist(), df.index.to_numpy(), column, batch_size)
+    return index
+
+
+def semantic_search(query, df, index, embedder, top_n=30, nprobe=None):
+    '''
+    improved_semantic_search without the corpus pass: the query is embedded and
+    matched against the index. Returns the top_n rows of df with a similarity column,
+    best first.
+    '''
+    query_embedding = np.asarray(embedder.embed([query])[0], dtype=np.float32)
+    similarities, ids = index.search(query_embedding, top_n, nprobe)
+    # Padding of a short nprobe search and articles indexed from another DataFrame
+    # (missing ids, or another text under the same id) are skipped
+    found = (ids >= 0) & np.isin(ids, df.index)
+    found[found] = index.hashes_of(ids[found]) == text_hashes(df.loc[ids[found], index.manifest['column']].tolist())
+    filtered_df = df.loc[ids[found]].copy()
+    filtered_df['similarity'] = similarities[found]
+    return filtered_df.reset_index(drop=True)
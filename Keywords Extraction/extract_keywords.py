@@ -0,0 +1,46 @@
+import argparse
+import os
+
+from batch_keywords import DEFAULT_CACHE_SIZE, DEFAULT_CHUNK_SIZE, extract_corpus
+from build_index import read_articles
+from embedding_index import DEFAULT_INDEX_DIR, DEFAULT_MODEL, EmbeddingIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the keywords of every article with a pool of KeyBERT workers.')
+    parser.add_argument('input', help='Parquet or CSV of the articles.')
+    parser.add_argument('--out', default='keywords.csv')
+    parser.add_argument('--column', default='cleaned_Text')
+    parser.add_argument('--index', default=DEFAULT_INDEX_DIR, help='Embedding index to reuse document embeddings from.')
+    parser.add_argument('--model', default=None, help='Embedding model (default: the index model).')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: all cores).')
+    parser.add_argument('--threads', type=int, default=1, help='Torch threads per worker.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Articles per task.')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='Phrase embeddings kept per worker.')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--maxsum', action='store_true', help='Max Sum Distance instead of MMR (use_diversity=False).')
+    parser.add_argument('--diversity', type=float, default=0.7)
+    parser.add_argument('--nr-candidates', type=int, default=20)
+    args = parser.parse_args()
+
+    index_path, model = None, args.model or DEFAULT_MODEL
+    if os.path.exists(os.path.join(args.index, 'manifest.json')):
+        manifest = EmbeddingIndex(args.index).manifest
+        # Embeddings of another model or another column are not the documents' embeddings
+        if (args.model is None or args.model == manifest['model']) and manifest['column'] == args.column:
+            index_path, model = args.index, manifest['model']
+    if index_path is None:
+        print(f"Not reusing '{args.index}': document embeddings are computed.")
+
+    stats = extract_corpus(
+        read_articles(args.input), args.out, args.column, model, index_path, args.jobs, args.chunk_size, args.threads,
+        top_n=args.top_n, use_mmr=not args.maxsum, diversity=args.diversity, nr_candidates=args.nr_candidates,
+        cache_size=args.cache_size,
+    )
+    print(f"{stats['articles']} articles, {stats['keywords']} keywords in {stats['seconds']:.1f}s "
+          f"({stats['articles_per_second']:.1f} articles/s); phrase cache hit rate {stats['cache_hit_rate']:.1%}, "
+          f"{stats['doc_embeddings_reused']} document embeddings reused; saved to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import time
+
+from build_index import read_articles
+from embedding_index import DEFAULT_INDEX_DIR, EmbeddingIndex, load_embedder, semantic_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the articles closest to a query in the embedding index.')
+    parser.add_argument('query')
+    parser.add_argument('input', help='The articles the index was built from.')
+    parser.add_argument('--index', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--top-n', type=int, default=30)
+    parser.add_argument('--nprobe', type=int, default=None, help='IVF lists to scan (default: exact search).')
+    args = parser.parse_args()
+
+    df = read_articles(args.input)
+    index = EmbeddingIndex(args.index)
+    embedder = load_embedder(index.manifest['model'])
+
+    start = time.perf_counter()
+    filtered_df = semantic_search(args.query, df, index, embedder, args.top_n, args.nprobe)
+    print(f"Semantic search over {len(index)} articles completed in {time.perf_counter() - start:.3f} seconds")
+    columns = [column for column in ['source_name', 'similarity'] if column in filtered_df]
+    print(filtered_df[columns].to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,60 @@
-from sklearn.metrics.pairwise import cosine_similarity
-from io import BytesIO
-import requests
-from PIL import Image
-from sklearn.feature_extraction.text import TfidfVectorizer
-import pandas as pd
 import streamlit as st
 
+from query_cache import ResultCache, normalize_ingredients
+from recipe_index import StaleIndexError, load_index
+from scoring import search
+from thumbnails import ThumbnailValidator
 
-df = pd.read_csv('Data/cleaned_food.csv')
 
-df['cleaned_ingredients'] = df['cleaned_ingredients'].apply(lambda x: x.replace('[', '').replace(']', '').replace("'", '').split(', '))
+RECIPES_CSV = 'Data/cleaned_food.csv'
 
-vectorizer = TfidfVectorizer()
-tfid_vectorizer = vectorizer.fit_transform(df['cleaned_ingredients'].apply(lambda x: ', '.join(x)))
+
+@st.cache_resource  # Load the prebuilt index once per process, not on every rerun
+def get_recipe_index():
+    # Read-only, like app.py: the index is only written by build_index.py
+    return load_index(RECIPES_CSV)
+
+
+@st.cache_resource  # One pooled validator (and its URL health cache) shared by all sessions
+def get_thumbnail_validator():
+    return ThumbnailValidator(max_workers=5)
+
+
+@st.cache_resource  # Rankings survive reruns and are shared by all sessions
+def get_result_cache():
+    return ResultCache(maxsize=1000, ttl=3600)
+
+
+try:
+    recipe_index = get_recipe_index()
+except StaleIndexError as e:
+    st.error(f"{e} Run `python build_index.py --csv {RECIPES_CSV}` and reload this page.")
+    st.stop()
+thumbnail_validator = get_thumbnail_validator()
+result_cache = get_result_cache()
 
 st.title('Recipe Recommender')
 
 user_input = st.text_input('Enter the ingredients separated by commas:')
 
 if st.button('Recommend'):
-    user_input = user_input.lower().split(', ')
-    user_input_vector = vectorizer.transform([', '.join(user_input)])
-    cosine_similarities = cosine_similarity(tfid_vectorizer, user_input_vector).flatten()
+    user_input = normalize_ingredients(user_input)
+    cache_key = (recipe_index.checksum, user_input, 5)
+    top_5_indices = result_cache.get(cache_key)
+    if top_5_indices is None:
+        top_ids, _ = search(recipe_index, recipe_index.transform(user_input), k=5)
+        top_5_indices = result_cache.put(cache_key, tuple(top_ids.tolist()))
 
-    top_5_indices = cosine_similarities.argsort()[-5:][::-1]
-    recommended_recipes = df.iloc[top_5_indices]
+    recipes = [recipe_index.recipe(index) for index in top_5_indices]
+    validation = thumbnail_validator.validate([recipe['thumbnail_url'] for recipe in recipes])
+    if validation.timed_out:
+        st.warning(f"Skipped {len(validation.timed_out)} recipes whose images did not load in time.")
 
-    for index, recipe in recommended_recipes.iterrows():
+    for recipe in recipes:
         image_url = recipe['thumbnail_url']
-        image = Image.open(BytesIO(requests.get(image_url).content))
-        st.image(image, caption=recipe['name'], width=800,use_column_width=True, output_format='JPEG')
+        if not validation.is_valid(image_url):
+            continue
+        st.image(image_url, caption=recipe['name'], width=800,use_column_width=True, output_format='JPEG')
 
         st.write(f"Protein: {int(recipe['protein'])}")
         st.write(f"Fat: {int(recipe['fat'])}") 
@@ -37,7 +62,7 @@ if st.button('Recommend'):
         st.write(f"Sugar: {int(recipe['sugar'])}") 
         st.write(f"Carbohydrates: {int(recipe['carbohydrates'])}")
 
-        ingredients_list = ", ".join(recipe['cleaned_ingredients'])
+        ingredients_list = ", ".join(ingredient.strip("'") for ingredient in recipe['cleaned_ingredients'])
         ingredients_list = ingredients_list.replace(",", ", ")
         st.write(f"Ingredients:  {ingredients_list}")
 
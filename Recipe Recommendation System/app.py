@@ -1,67 +1,163 @@
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from fastapi import FastAPI
+import json
+from typing import List
+
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from io import BytesIO
-import requests
-from PIL import Image
+
+from instrumentation import count, instrument_fastapi, stage
+from query_cache import ResultCache, normalize_ingredients
+from recipe_index import load_index
+from scoring import search, search_batch
+from thumbnails import ThumbnailValidator
 
 app = FastAPI()
 
+# Request latency, /metrics and the runtime profiler toggle
+instrument_fastapi(app)
+
+# Built offline by build_index.py; loaded once and shared read-only by every request
+with stage('load_index'):
+    recipe_index = load_index()
+
+# Thumbnails are checked concurrently and their health is cached between requests
+thumbnail_validator = ThumbnailValidator(max_workers=16, request_timeout=2.0)
+THUMBNAIL_DEADLINE = 3.0
+
+# Rankings keyed on (index checksum, normalized ingredients, k)
+result_cache = ResultCache(maxsize=10_000, ttl=3600)
+
+
+@app.on_event("startup")
+def start_thumbnail_revalidator():
+    thumbnail_validator.start_revalidator()
+
+
+@app.on_event("shutdown")
+def stop_thumbnail_validator():
+    thumbnail_validator.close()
+
 
 class IngredientsInput(BaseModel):
     ingredients: str
 
 
-@app.post("/recommend_recipes")
-def recommend_recipes(ingredients_input: IngredientsInput):
-
-    df = pd.read_csv('Data/Food_Dataset.csv')
-    df['cleaned_ingredients'] = df['cleaned_ingredients'].apply(lambda x: [ingredient.strip()for ingredient in x.strip('[]').split(',')])
+class BatchIngredientsInput(BaseModel):
+    ingredients: List[str]
 
-    vectorizer = TfidfVectorizer()
-    tfidf_vectorizer = vectorizer.fit_transform(df['cleaned_ingredients'].apply(lambda x: ', '.join(x)))
 
-    user_input = ingredients_input.ingredients.lower().split(', ')
-    user_input_vector = vectorizer.transform([', '.join(user_input)])
+def validate_thumbnails(recipes):
+    '''
+    Validate the thumbnails of one response under THUMBNAIL_DEADLINE and record the
+    timed-out and cache-hit counters.
+    '''
+    with stage('validate_thumbnails'):
+        validation = thumbnail_validator.validate([recipe['thumbnail_url'] for recipe in recipes], deadline=THUMBNAIL_DEADLINE)
+    if validation.timed_out:
+        print(f"Dropped {len(validation.timed_out)} recipes whose thumbnails timed out")
+        count("thumbnail_timed_out", len(validation.timed_out))
+    count("thumbnail_cache_hit", validation.cache_hits)
+    return validation
 
-    cosine_similarities = cosine_similarity(tfidf_vectorizer, user_input_vector).flatten()
-    top_25_indices = cosine_similarities.argsort()[-26:][::-1]  
-    recommended_recipes = df.iloc[top_25_indices]
 
+def build_response_data(recipes, validation):
+    '''
+    Turn recipes into the response schema, leaving out those without a working thumbnail.
+    '''
     response_data = []
-    for index, recipe in recommended_recipes.iterrows():
-        try:
-            image_url = recipe['thumbnail_url']
-            response = requests.get(image_url)
-            response.raise_for_status()  # Raise an exception if the request fails
-            image = Image.open(BytesIO(response.content))
-
-            recipe_data = {
-                "recipe_image": recipe['thumbnail_url'],
-                "recipe_name": recipe['name'],
-                "ingredients": recipe['cleaned_ingredients'],
-                "protein": recipe['protein'],
-                "fat": recipe['fat'],
-                "calories": recipe['calories'],
-                "sugar": recipe['sugar'],
-                "carbohydrates": recipe['carbohydrates'],
-                "fiber": recipe['fiber'],
-                "instructions": recipe['cleaned_instructions'],
-                "recipe_video": recipe['video_url']                
-            }
-
-            response_data.append(recipe_data)
-
-        except requests.exceptions.RequestException as e:
-            # Handling image fetching errors
-            print(f"Error fetching image: {e}")
+    for recipe in recipes:
+        if not validation.is_valid(recipe['thumbnail_url']):
             continue
 
+        recipe_data = {
+            "recipe_image": recipe['thumbnail_url'],
+            "recipe_name": recipe['name'],
+            "ingredients": recipe['cleaned_ingredients'],
+            "protein": recipe['protein'],
+            "fat": recipe['fat'],
+            "calories": recipe['calories'],
+            "sugar": recipe['sugar'],
+            "carbohydrates": recipe['carbohydrates'],
+            "fiber": recipe['fiber'],
+            "instructions": recipe['cleaned_instructions'],
+            "recipe_video": recipe['video_url']                
+        }
+
+        response_data.append(recipe_data)
+
     return response_data
 
 
+@app.post("/recommend_recipes")
+def recommend_recipes(ingredients_input: IngredientsInput, response: Response):
+
+    with stage('normalize'):
+        user_input = normalize_ingredients(ingredients_input.ingredients)
+    cache_key = (recipe_index.checksum, user_input, 26)
+
+    top_25_indices = result_cache.get(cache_key)
+    response.headers["X-Result-Cache"] = "hit" if top_25_indices is not None else "miss"
+    count("result_cache_hit" if top_25_indices is not None else "result_cache_miss")
+    if top_25_indices is None:
+        with stage('vectorize'):
+            user_input_vector = recipe_index.transform(user_input)
+        # Only recipes sharing an ingredient term with the query are scored
+        with stage('search'):
+            top_ids, _ = search(recipe_index, user_input_vector, k=26)
+        top_25_indices = result_cache.put(cache_key, tuple(top_ids.tolist()))
+
+    with stage('load_recipes'):
+        recipes = [recipe_index.recipe(index) for index in top_25_indices]
+
+    # Validate every thumbnail at once instead of one blocking request per recipe
+    validation = validate_thumbnails(recipes)
+    response.headers["X-Thumbnails-Timed-Out"] = str(len(validation.timed_out))
+    response.headers["X-Thumbnails-Cache-Hits"] = str(validation.cache_hits)
+
+    with stage('build_response'):
+        return build_response_data(recipes, validation)
+
+
+@app.post("/recommend_recipes/batch")
+def recommend_recipes_batch(batch_input: BatchIngredientsInput):
+    '''
+    Recommend recipes for many ingredient lists at once. The response is NDJSON: one line
+    per input, in input order, each with the same schema as /recommend_recipes.
+    '''
+    user_inputs = [normalize_ingredients(ingredients) for ingredients in batch_input.ingredients]
+
+    def generate(chunk_size=64):
+        for start in range(0, len(user_inputs), chunk_size):
+            cache_keys = [(recipe_index.checksum, user_input, 26) for user_input in user_inputs[start:start + chunk_size]]
+            rankings = [result_cache.get(cache_key) for cache_key in cache_keys]
+
+            # Cache misses of the chunk are vectorized together and scored in one product
+            missing = [i for i, ranking in enumerate(rankings) if ranking is None]
+            count("result_cache_hit", len(rankings) - len(missing))
+            count("result_cache_miss", len(missing))
+            if missing:
+                with stage('batch_vectorize'):
+                    query_matrix = recipe_index.transform_batch([cache_keys[i][1] for i in missing])
+                with stage('batch_search'):
+                    for i, (top_ids, _) in zip(missing, search_batch(recipe_index, query_matrix, k=26, chunk_size=chunk_size)):
+                        rankings[i] = result_cache.put(cache_keys[i], tuple(top_ids.tolist()))
+
+            with stage('load_recipes'):
+                chunk = [[recipe_index.recipe(index) for index in ranking] for ranking in rankings]
+
+            # Each input gets the same thumbnail deadline as a single /recommend_recipes call;
+            # one deadline for the whole chunk would time out most of a cold cache
+            for recipes in chunk:
+                yield json.dumps(build_response_data(recipes, validate_thumbnails(recipes))) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    return {"results": result_cache.stats(), "index_checksum": recipe_index.checksum}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,23 @@
+import argparse
+import time
+
+from recipe_index import DEFAULT_CSV_PATH, build_index, default_index_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the TF-IDF recipe index used by app.py and Streamlit.py.')
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH, help='Recipe dataset to index.')
+    parser.add_argument('--out', default=None, help='Output directory (default: <csv name>_index next to the CSV).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = build_index(args.csv, args.out)
+    elapsed = time.perf_counter() - start
+
+    print(f"Indexed {manifest['n_recipes']} recipes over {manifest['n_terms']} terms "
+          f"into '{args.out or default_index_dir(args.csv)}' in {elapsed:.2f}s")
+    print(f"CSV checksum: {manifest['csv_sha256']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Users separate ingredients with commas, semicolons, pipes or new lines
+SEPARATORS = re.compile(r'[,;|\n]+')
+
+
+def normalize_ingredients(text):
+    '''
+    Canonical form of an ingredient query: lowercased, trimmed, inner whitespace
+    collapsed, duplicates and empty entries dropped, sorted.
+
+    "chicken, cheese" and "Cheese,chicken " both become ('cheese', 'chicken').
+    '''
+    ingredients = {' '.join(part.lower().split()) for part in SEPARATORS.split(text)}
+    ingredients.discard('')
+    return tuple(sorted(ingredients))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL for recommendation results.
+
+    Keys should include the index checksum so results computed on an older index are
+    never served after a rebuild, e.g. (recipe_index.checksum, normalized_ingredients, k).
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        '''
+        Return the cached value for key, or None on a miss.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
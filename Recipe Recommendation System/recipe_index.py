@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Bump this whenever the on-disk layout or the way the corpus is built changes
+INDEX_VERSION = 2
+
+DEFAULT_CSV_PATH = 'Data/Food_Dataset.csv'
+
+NUMERIC_COLUMNS = ['protein', 'fat', 'calories', 'sugar', 'carbohydrates', 'fiber']
+TEXT_COLUMNS = ['name', 'thumbnail_url', 'video_url', 'cleaned_instructions']
+
+
+class StaleIndexError(RuntimeError):
+    """
+    Raised when the index on disk is missing, was built by another INDEX_VERSION
+    or no longer matches the CSV it was built from.
+    """
+
+
+def default_index_dir(csv_path):
+    '''
+    The index for "Data/Food_Dataset.csv" lives in "Data/Food_Dataset_index/".
+    '''
+    return os.path.splitext(csv_path)[0] + '_index'
+
+
+def parse_ingredients(raw):
+    '''
+    Turn the stringified list stored in the CSV into a list of ingredients.
+    '''
+    return [ingredient.strip() for ingredient in raw.strip('[]').split(',')]
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class RecipeIndex:
+    """
+    Read-only TF-IDF index over the recipe dataset.
+
+    The document matrix and the numeric metadata columns are memory-mapped, so every
+    worker that loads the same index shares the same pages through the OS page cache.
+    """
+
+    def __init__(self, vectorizer, tfidf_matrix, postings, numeric_columns, text_columns, ingredients, manifest):
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        # Inverted index over the same weights: term -> (recipe ids, tf-idf weights)
+        self.postings_indptr, self.postings_docs, self.postings_weights = postings
+        # The posting lists seen as the transposed document matrix (terms x recipes)
+        self.postings_matrix = csr_matrix(
+            (self.postings_weights, self.postings_docs, self.postings_indptr),
+            shape=(tfidf_matrix.shape[1], tfidf_matrix.shape[0]),
+            copy=False,
+        )
+        self.numeric_columns = numeric_columns
+        self.text_columns = text_columns
+        self.ingredients = ingredients
+        self.manifest = manifest
+
+    @property
+    def checksum(self):
+        return self.manifest['csv_sha256']
+
+    def __len__(self):
+        return self.tfidf_matrix.shape[0]
+
+    def transform(self, ingredients):
+        '''
+        Vectorize a list of ingredients the same way the corpus was vectorized.
+        '''
+        return self.vectorizer.transform([', '.join(ingredients)])
+
+    def transform_batch(self, ingredient_lists):
+        '''
+        Vectorize many ingredient lists at once into one sparse query matrix.
+        '''
+        return self.vectorizer.transform([', '.join(ingredients) for ingredients in ingredient_lists])
+
+    def recipe(self, i):
+        '''
+        Return the metadata of the i-th recipe as a plain dict.
+        '''
+        record = {column: values[i] for column, values in self.text_columns.items()}
+        record.update({column: values[i].item() for column, values in self.numeric_columns.items()})
+        record['cleaned_ingredients'] = self.ingredients[i]
+        return record
+
+
+def build_index(csv_path=DEFAULT_CSV_PATH, index_dir=None):
+    '''
+    Fit the TF-IDF vectorizer on the recipe CSV and write everything the services need
+    to serve queries into index_dir.
+    '''
+    index_dir = index_dir or default_index_dir(csv_path)
+    os.makedirs(index_dir, exist_ok=True)
+
+    df = pd.read_csv(csv_path)
+    ingredients = df['cleaned_ingredients'].apply(parse_ingredients)
+
+    vectorizer = TfidfVectorizer()
+    tfidf_matrix = vectorizer.fit_transform(ingredients.apply(lambda x: ', '.join(x)))
+    tfidf_matrix = csr_matrix(tfidf_matrix)
+    tfidf_matrix.sort_indices()
+
+    # Fitted vocabulary ordered by column index, plus the IDF weights
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+    with open(os.path.join(index_dir, 'terms.json'), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.save(os.path.join(index_dir, 'idf.npy'), vectorizer.idf_)
+
+    # The L2-normalized document matrix as raw CSR arrays so it can be memory-mapped
+    np.save(os.path.join(index_dir, 'tfidf_data.npy'), tfidf_matrix.data)
+    np.save(os.path.join(index_dir, 'tfidf_indices.npy'), tfidf_matrix.indices)
+    np.save(os.path.join(index_dir, 'tfidf_indptr.npy'), tfidf_matrix.indptr)
+
+    # Posting lists are the CSC layout of the same matrix (recipe ids sorted within each term)
+    postings = tfidf_matrix.tocsc()
+    postings.sort_indices()
+    np.save(os.path.join(index_dir, 'postings_indptr.npy'), postings.indptr)
+    np.save(os.path.join(index_dir, 'postings_docs.npy'), postings.indices)
+    np.save(os.path.join(index_dir, 'postings_weights.npy'), postings.data)
+
+    # Column-oriented recipe metadata: one .npy per numeric column, one JSON table for text
+    for column in NUMERIC_COLUMNS:
+        np.save(os.path.join(index_dir, f'{column}.npy'), df[column].to_numpy())
+    text_table = {column: df[column].astype(object).where(df[column].notna(), None).tolist() for column in TEXT_COLUMNS}
+    text_table['cleaned_ingredients'] = ingredients.tolist()
+    with open(os.path.join(index_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(text_table, f, ensure_ascii=False)
+
+    stat = os.stat(csv_path)
+    manifest = {
+        'index_version': INDEX_VERSION,
+        'csv_path': os.path.abspath(csv_path),
+        'csv_size': stat.st_size,
+        'csv_mtime': stat.st_mtime,
+        'csv_sha256': file_checksum(csv_path),
+        'n_recipes': tfidf_matrix.shape[0],
+        'n_terms': tfidf_matrix.shape[1],
+    }
+    # Write the manifest last: an index without one is never considered valid
+    with open(os.path.join(index_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def check_index(csv_path, manifest):
+    '''
+    Raise StaleIndexError if the manifest does not describe the current CSV.
+    '''
+    if manifest.get('index_version') != INDEX_VERSION:
+        raise StaleIndexError(
+            f"Index version {manifest.get('index_version')} does not match {INDEX_VERSION}."
+        )
+    stat = os.stat(csv_path)
+    # Cheap check first; only hash the CSV when size or mtime changed
+    if stat.st_size == manifest['csv_size'] and stat.st_mtime == manifest['csv_mtime']:
+        return
+    if file_checksum(csv_path) != manifest['csv_sha256']:
+        raise StaleIndexError(f"'{csv_path}' changed since the index was built.")
+
+
+def load_index(csv_path=DEFAULT_CSV_PATH, index_dir=None, rebuild=False):
+    '''
+    Load the index built from csv_path. A missing or stale index raises StaleIndexError,
+    unless rebuild is True, in which case it is rebuilt first.
+    '''
+    index_dir = index_dir or default_index_dir(csv_path)
+    manifest_path = os.path.join(index_dir, 'manifest.json')
+
+    try:
+        if not os.path.exists(manifest_path):
+            raise StaleIndexError(f"No index found in '{index_dir}'.")
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        check_index(csv_path, manifest)
+    except StaleIndexError:
+        if not rebuild:
+            raise
+        build_index(csv_path, index_dir)
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    with open(os.path.join(index_dir, 'terms.json'), encoding='utf-8') as f:
+        terms = json.load(f)
+    vectorizer = TfidfVectorizer(vocabulary={term: column for column, term in enumerate(terms)})
+    vectorizer.idf_ = np.load(os.path.join(index_dir, 'idf.npy'))
+
+    tfidf_matrix = csr_matrix(
+        (
+            np.load(os.path.join(index_dir, 'tfidf_data.npy'), mmap_mode='r'),
+            np.load(os.path.join(index_dir, 'tfidf_indices.npy'), mmap_mode='r'),
+            np.load(os.path.join(index_dir, 'tfidf_indptr.npy'), mmap_mode='r'),
+        ),
+        shape=(manifest['n_recipes'], manifest['n_terms']),
+        copy=False,
+    )
+    postings = tuple(
+        np.load(os.path.join(index_dir, f'postings_{name}.npy'), mmap_mode='r')
+        for name in ('indptr', 'docs', 'weights')
+    )
+
+    numeric_columns = {
+        column: np.load(os.path.join(index_dir, f'{column}.npy'), mmap_mode='r')
+        for column in NUMERIC_COLUMNS
+    }
+    with open(os.path.join(index_dir, 'metadata.json'), encoding='utf-8') as f:
+        text_table = json.load(f)
+    ingredients = text_table.pop('cleaned_ingredients')
+
+    return RecipeIndex(vectorizer, tfidf_matrix, postings, numeric_columns, text_table, ingredients, manifest)
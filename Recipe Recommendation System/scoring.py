@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def score_candidates(postings_indptr, postings_docs, postings_weights, query_vector):
+    '''
+    Score only the recipes that share at least one term with the query by walking the
+    posting lists of the query terms.
+
+    Returns the candidate recipe ids (sorted) and their cosine similarity. Both the
+    recipe rows and the query are L2-normalized, so the dot product is the cosine.
+    Contributions are added term by term in increasing term id, which is the same
+    order a CSR matrix-vector product uses, so the scores are bit-identical to
+    tfidf_matrix @ query_vector.T.
+    '''
+    order = np.argsort(query_vector.indices, kind='stable')
+    terms = query_vector.indices[order]
+    query_weights = query_vector.data[order]
+
+    starts = postings_indptr[terms]
+    ends = postings_indptr[terms + 1]
+    if not np.any(ends > starts):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    docs = np.concatenate([postings_docs[start:end] for start, end in zip(starts, ends)])
+    contributions = np.concatenate([
+        postings_weights[start:end] * weight for start, end, weight in zip(starts, ends, query_weights)
+    ])
+
+    # bincount adds the contributions of each recipe in array order, i.e. term order
+    candidates, inverse = np.unique(docs, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions, minlength=len(candidates))
+    return candidates.astype(np.int64), scores
+
+
+def select_top_k(candidates, scores, k, n_recipes):
+    '''
+    Pick the k best recipes ordered by score, breaking ties by the higher recipe id.
+
+    That is exactly the order of argsort(kind='stable')[-k:][::-1] over the scores of
+    every recipe. When fewer than k recipes share a term with the query the remaining
+    slots are filled with zero-score recipes, again highest id first.
+
+    The app used to rank with the default argsort(), a quicksort whose order among equal
+    scores is arbitrary, so results can differ from it wherever scores tie (most often
+    in the zero-score filler of short queries). Recipes with distinct scores rank the same.
+    '''
+    if len(candidates) > k:
+        # Keep everything tied with the k-th best score so tie-breaking stays exact
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= threshold
+        candidates, scores = candidates[keep], scores[keep]
+
+    order = np.lexsort((-candidates, -scores))[:k]
+    top_ids, top_scores = candidates[order], scores[order]
+
+    missing = min(k, n_recipes) - len(top_ids)
+    if missing > 0:
+        window = np.arange(n_recipes - 1, max(n_recipes - 1 - missing - len(candidates), -1), -1)
+        filler = window[~np.isin(window, candidates, assume_unique=True)][:missing]
+        top_ids = np.concatenate([top_ids, filler])
+        top_scores = np.concatenate([top_scores, np.zeros(len(filler))])
+    return top_ids, top_scores
+
+
+def search(recipe_index, query_vector, k):
+    '''
+    Top-k recipes for an already vectorized query using the inverted index.
+    '''
+    candidates, scores = score_candidates(
+        recipe_index.postings_indptr, recipe_index.postings_docs, recipe_index.postings_weights, query_vector
+    )
+    return select_top_k(candidates, scores, k, len(recipe_index))
+
+
+def search_batch(recipe_index, query_matrix, k, chunk_size=256):
+    '''
+    Top-k recipes for every row of a vectorized query matrix.
+
+    Each chunk of queries is scored with one sparse-sparse product against the posting
+    lists, which adds contributions in the same order as search(), so every row gets
+    exactly the ranking a single query would. Yields (top_ids, top_scores) per row.
+    '''
+    n_recipes = len(recipe_index)
+    for start in range(0, query_matrix.shape[0], chunk_size):
+        chunk = query_matrix[start:start + chunk_size]
+        chunk.sort_indices()
+        scores = chunk @ recipe_index.postings_matrix
+        for row in range(scores.shape[0]):
+            row_start, row_end = scores.indptr[row], scores.indptr[row + 1]
+            candidates = scores.indices[row_start:row_end].astype(np.int64)
+            yield select_top_k(candidates, scores.data[row_start:row_end], k, n_recipes)
+
+
+def brute_force_search(tfidf_matrix, query_vector, k):
+    '''
+    Reference implementation: score every recipe and sort all of them, with the same
+    tie-breaking as select_top_k.
+    '''
+    scores = (tfidf_matrix @ query_vector.T).toarray().ravel()
+    top_ids = scores.argsort(kind='stable')[-k:][::-1]
+    return top_ids, scores[top_ids]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service modules are imported from the service directory, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
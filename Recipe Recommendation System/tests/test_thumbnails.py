@@ -0,0 +1,116 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from instrumentation import EVENTS
+from thumbnails import ThumbnailValidator
+
+
+def png_bytes():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG = png_bytes()
+
+# path -> (status, body, delay in seconds)
+ROUTES = {
+    '/ok.png': (200, PNG, 0),
+    '/missing.png': (404, b'not found', 0),
+    '/corrupt.png': (200, PNG[:16], 0),  # truncated inside the header: PIL raises OSError
+    '/not-an-image.png': (200, b'<html></html>', 0),
+    '/slow.png': (200, PNG, 1.0),
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        status, body, delay = ROUTES.get(self.path, (404, b'', 0))
+        time.sleep(delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on a slow URL
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.hits = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+@pytest.fixture
+def validator():
+    validator = ThumbnailValidator(max_workers=4, request_timeout=0.3)
+    yield validator
+    validator.close()
+
+
+def test_valid_missing_and_broken_images(server, validator):
+    urls = [url(server, path) for path in ['/ok.png', '/missing.png', '/corrupt.png', '/not-an-image.png']]
+    unreadable = EVENTS.value(event='thumbnail_unreadable')
+    fetch_failed = EVENTS.value(event='thumbnail_fetch_failed')
+
+    result = validator.validate(urls + ['', None], deadline=2.0)
+
+    assert result.valid == {urls[0]: True, urls[1]: False, urls[2]: False, urls[3]: False, '': False, None: False}
+    assert result.timed_out == []
+    assert EVENTS.value(event='thumbnail_unreadable') == unreadable + 1
+    assert EVENTS.value(event='thumbnail_fetch_failed') == fetch_failed + 2
+
+
+def test_results_are_cached(server, validator):
+    ok, missing = url(server, '/ok.png'), url(server, '/missing.png')
+    validator.validate([ok, missing], deadline=2.0)
+    hits = dict(server.hits)
+
+    result = validator.validate([ok, missing, ok], deadline=2.0)
+
+    assert result.valid == {ok: True, missing: False}
+    assert result.cache_hits == 2
+    assert server.hits == hits
+
+
+def test_request_timeout_is_reported_and_not_cached(server, validator):
+    slow = url(server, '/slow.png')
+
+    result = validator.validate([slow, url(server, '/ok.png')], deadline=2.0)
+
+    assert result.timed_out == [slow]
+    assert slow not in result.valid
+    assert validator.cached(slow) is None
+
+
+def test_batch_deadline(server):
+    validator = ThumbnailValidator(max_workers=2, request_timeout=5.0)
+    slow = url(server, '/slow.png')
+    try:
+        start = time.monotonic()
+        result = validator.validate([slow], deadline=0.2)
+        assert time.monotonic() - start < 0.9
+        assert result.timed_out == [slow]
+        assert not result.is_valid(slow)
+    finally:
+        validator.close()
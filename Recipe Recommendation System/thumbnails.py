@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+import requests
+from PIL import Image, UnidentifiedImageError
+
+from instrumentation import count, stage
+
+
+class ValidationResult:
+    """
+    Outcome of validating a batch of thumbnail URLs.
+
+    valid maps every URL that was checked (or found in the cache) to True/False.
+    URLs that did not answer before their timeout or the batch deadline are listed in
+    timed_out and are not in valid.
+    """
+
+    def __init__(self):
+        self.valid = {}
+        self.timed_out = []
+        self.cache_hits = 0
+
+    def is_valid(self, url):
+        return self.valid.get(url, False)
+
+
+class ThumbnailValidator:
+    """
+    Checks that recipe thumbnails can be downloaded and opened as images.
+
+    Requests go through one pooled requests.Session on a bounded thread pool, and
+    results are kept in a TTL cache so repeated recipes are not fetched again.
+    """
+
+    def __init__(self, max_workers=8, request_timeout=2.0, ttl=3600, failure_ttl=300, session=None):
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail')
+
+        # url -> (is_valid, expires_at, last_used)
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._stop_revalidator = threading.Event()
+        self._revalidator = None
+
+    @stage('thumbnail_fetch')
+    def check_url(self, url):
+        '''
+        Fetch a single thumbnail. Returns True/False, or None if it timed out.
+        '''
+        try:
+            response = self.session.get(url, timeout=self.request_timeout)
+            response.raise_for_status()
+            Image.open(BytesIO(response.content))
+            return True
+        except requests.exceptions.Timeout:
+            return None
+        except (requests.exceptions.RequestException, UnidentifiedImageError):
+            count('thumbnail_fetch_failed')
+            return False
+        except (OSError, SyntaxError, ValueError):
+            # Truncated or corrupt image data; PIL raises these from its decoders
+            count('thumbnail_unreadable')
+            return False
+
+    def _store(self, url, is_valid, last_used=None):
+        now = time.monotonic()
+        ttl = self.ttl if is_valid else self.failure_ttl
+        with self._lock:
+            if last_used is None:
+                last_used = now
+            self._cache[url] = (is_valid, now + ttl, last_used)
+
+    def cached(self, url):
+        '''
+        Return the cached health of url, or None if unknown or expired.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is None or entry[1] < now:
+                return None
+            self._cache[url] = (entry[0], entry[1], now)
+        return entry[0]
+
+    def validate(self, urls, deadline=5.0):
+        '''
+        Validate urls concurrently, giving up on whatever has not finished after
+        deadline seconds.
+        '''
+        result = ValidationResult()
+        pending = {}
+        for url in dict.fromkeys(urls):
+            if not isinstance(url, str) or not url:
+                result.valid[url] = False
+                continue
+            is_valid = self.cached(url)
+            if is_valid is not None:
+                result.valid[url] = is_valid
+                result.cache_hits += 1
+            else:
+                pending[self.executor.submit(self.check_url, url)] = url
+
+        if not pending:
+            return result
+
+        done, not_done = wait(pending, timeout=deadline)
+        for future in done:
+            url = pending[future]
+            is_valid = future.result()
+            if is_valid is None:
+                result.timed_out.append(url)
+            else:
+                self._store(url, is_valid)
+                result.valid[url] = is_valid
+        for future in not_done:
+            # Still running threads finish on their own; their result is simply dropped
+            future.cancel()
+            result.timed_out.append(pending[future])
+        return result
+
+    def start_revalidator(self, interval=60, refresh_ahead=120):
+        '''
+        Start a daemon thread that re-checks cached URLs shortly before they expire,
+        so popular recipes never pay for a fetch on the request path. Entries that
+        were not used during the last ttl seconds are evicted instead.
+        '''
+        if self._revalidator is not None:
+            return
+        self._stop_revalidator.clear()
+        self._revalidator = threading.Thread(
+            target=self._revalidate_loop, args=(interval, refresh_ahead), name='thumbnail-revalidator', daemon=True
+        )
+        self._revalidator.start()
+
+    def _revalidate_loop(self, interval, refresh_ahead):
+        while not self._stop_revalidator.wait(interval):
+            now = time.monotonic()
+            due = []
+            with self._lock:
+                for url, (_, expires_at, last_used) in list(self._cache.items()):
+                    if expires_at < now or last_used < now - self.ttl:
+                        del self._cache[url]
+                    elif expires_at < now + refresh_ahead:
+                        due.append((url, last_used))
+            for url, last_used in due:
+                if self._stop_revalidator.is_set():
+                    return
+                is_valid = self.check_url(url)
+                if is_valid is not None:
+                    self._store(url, is_valid, last_used)
+
+    def close(self):
+        self._stop_revalidator.set()
+        if self._revalidator is not None:
+            self._revalidator.join()
+            self._revalidator = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
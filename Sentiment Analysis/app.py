@@ -0,0 +1,44 @@
+import os
+
+from flask import Flask, request, jsonify
+
+from instrumentation import instrument_flask, stage
+from serving import DEFAULT_MODEL_DIR, MicroBatcher, SentimentClassifier
+
+app = Flask(__name__)
+
+# Request latency, /metrics and the runtime profiler toggle
+instrument_flask(app)
+
+# int8 Linear layers unless QUANTIZE=0
+with stage('load_model'):
+    classifier = SentimentClassifier.from_pretrained(
+        os.getenv('MODEL_DIR', DEFAULT_MODEL_DIR),
+        quantize=os.getenv('QUANTIZE', '1') == '1',
+        num_threads=int(os.getenv('NUM_THREADS', 0)) or None,
+    )
+
+# Tweets from concurrent requests are scored together, waiting at most MAX_LATENCY_MS for a batch to fill
+batcher = MicroBatcher(
+    classifier,
+    max_batch_size=int(os.getenv('MAX_BATCH_SIZE', 64)),
+    max_latency=float(os.getenv('MAX_LATENCY_MS', 10)) / 1000,
+).start()
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    data = request.get_json(silent=True) or {}
+    sentences = data.get('sentences', [data['sentence']] if 'sentence' in data else None)
+    if not isinstance(sentences, list) or not all(isinstance(sentence, str) for sentence in sentences):
+        return jsonify({'error': "Expected 'sentence' or a list of 'sentences'."}), 400
+    return jsonify({'results': batcher.predict(sentences)})
+
+
+@app.route('/predict/stats', methods=['GET'])
+def predict_stats():
+    return jsonify(batcher.stats())
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 8000)), threaded=True)
@@ -0,0 +1,83 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from preprocessing import DEFAULT_CSV_PATH, read_sentiment140
+from serving import DEFAULT_MODEL_DIR, MicroBatcher, SentimentClassifier
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms"
+
+
+def run_unbatched(classifier, tweets):
+    '''
+    One forward pass per tweet, as a request handler calling the model directly would.
+    '''
+    latencies = []
+    start = time.perf_counter()
+    for tweet in tweets:
+        t = time.perf_counter()
+        classifier.predict([tweet])
+        latencies.append(time.perf_counter() - t)
+    return len(tweets) / (time.perf_counter() - start), latencies
+
+
+def run_batched(classifier, tweets, clients, max_batch_size, max_latency):
+    '''
+    `clients` threads sending one tweet at a time through a MicroBatcher.
+    '''
+    batcher = MicroBatcher(classifier, max_batch_size, max_latency).start()
+
+    def request(tweet):
+        t = time.perf_counter()
+        batcher.submit(tweet).result()
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = list(executor.map(request, tweets))
+    throughput = len(tweets) / (time.perf_counter() - start)
+    batcher.stop()
+    return throughput, latencies, batcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and latency of fp32 vs int8, unbatched vs micro-batched.')
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH, help='Sentiment140 CSV the tweets are sampled from.')
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    parser.add_argument('--n', type=int, default=2000, help='Tweets per run.')
+    parser.add_argument('--unbatched-n', type=int, default=300, help='Tweets for the one-at-a-time runs.')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent clients in the batched runs.')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    tweets = read_sentiment140(args.csv)['sentence'].sample(n=args.n, random_state=42).tolist()
+    labels = {}
+    for name, quantize in [('fp32', False), ('int8', True)]:
+        classifier = SentimentClassifier.from_pretrained(args.model_dir, quantize=quantize, num_threads=args.threads,
+                                                         batch_size=args.max_batch_size)
+        classifier.predict(tweets[:8])  # warm-up
+
+        throughput, latencies = run_unbatched(classifier, tweets[:args.unbatched_n])
+        print(f"{name} unbatched: {throughput:.1f} tweets/s, {latency_summary(latencies)}")
+
+        throughput, latencies, stats = run_batched(classifier, tweets, args.clients, args.max_batch_size,
+                                                   args.max_latency_ms / 1000)
+        print(f"{name} micro-batched ({args.clients} clients): {throughput:.1f} tweets/s, {latency_summary(latencies)}, "
+              f"mean batch {stats['mean_batch_size']:.1f}")
+
+        start = time.perf_counter()
+        labels[name] = classifier.predict_proba(tweets).argmax(axis=1)
+        print(f"{name} bulk: {len(tweets) / (time.perf_counter() - start):.1f} tweets/s")
+
+    print(f"int8 and fp32 labels agree on {np.mean(labels['fp32'] == labels['int8']):.2%} of the tweets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+from preprocessing import (DEFAULT_CACHE_DIR, DEFAULT_CSV_PATH, DEFAULT_MAX_LENGTH, DEFAULT_TOKENIZER,
+                           LengthBucketBatchSampler, balance_labels, clean_tweets, encode_cached, load_tokenizer,
+                           padding_stats, read_sentiment140, word_counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and encode Sentiment140 as in the notebook, cached as memory-mapped arrays.")
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--tokenizer', default=DEFAULT_TOKENIZER)
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument('--sample-size', type=int, default=440000, help='Tweets per label before cleaning.')
+    parser.add_argument('--final-sample-size', type=int, default=370000, help='Tweets per label after the word-count filter.')
+    parser.add_argument('--min-words', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=128, help='Training batch size, for the padding report.')
+    parser.add_argument('--jobs', type=int, default=None, help='Cleaning processes (default: all cores).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = balance_labels(read_sentiment140(args.csv), args.sample_size)
+    df['preprocessing_sentence'] = clean_tweets(df['sentence'], args.jobs)
+    df = df[word_counts(df['preprocessing_sentence']) >= args.min_words].reset_index(drop=True)
+    df = balance_labels(df, args.final_sample_size)
+    print(f"Cleaned {len(df):,} tweets in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    encoded = encode_cached(df['preprocessing_sentence'].tolist(), load_tokenizer(args.tokenizer), df['label'].to_numpy(),
+                            args.max_length, args.cache_dir)
+    print(f"Encoded tweets in '{encoded.path}' ({time.perf_counter() - start:.1f}s)")
+
+    batches = LengthBucketBatchSampler(encoded.lengths, args.batch_size).batches()
+    stats = padding_stats(encoded.lengths, batches, args.max_length)
+    print(f"Padding: {stats['fixed']:.1%} of the positions at max_length={args.max_length}, "
+          f"{stats['bucketed']:.1%} with length buckets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Bump this whenever the cached layout or the encoding changes
+CACHE_VERSION = 1
+
+DEFAULT_CSV_PATH = 'training.1600000.processed.noemoticon.csv'
+DEFAULT_CACHE_DIR = 'cache/encoded'
+DEFAULT_TOKENIZER = 'bert-base-uncased'
+DEFAULT_MAX_LENGTH = 64
+
+# The patterns of the notebook, compiled once
+URL_PATTERN = re.compile(r"((http://)[^ ]*|(https://)[^ ]*|(www\.)[^ ]*)")
+USER_PATTERN = re.compile(r'@[^\s]+')
+SEQUENCE_PATTERN = re.compile(r"(.)\1\1+")
+SEQ_REPLACE_PATTERN = r"\1\1"
+MENTION_OR_URL_PATTERN = re.compile(r"(?:\@|https?\://)\S+")
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+SPACES_PATTERN = re.compile(r"\s\s+")
+BANNED_TABLE = str.maketrans('', '', string.punctuation + 'Ã' + '±' + 'ã' + '¼' + 'â' + '»' + '§')
+
+
+def _replace_emoji(tweet):
+    import emoji
+    return emoji.replace_emoji(tweet, replace='')
+
+
+def clean_tweet(tweet):
+    '''
+    The notebook's clean_tweet with the same output.
+
+    Emojis are only looked up in tweets with non-ASCII characters, and the hashtag,
+    underscore, '$' and '&' passes are gone: those characters are all in
+    string.punctuation, so they are already removed when those passes ran.
+    '''
+    tweet = tweet.lower()
+    tweet = URL_PATTERN.sub('', tweet)
+    tweet = USER_PATTERN.sub('', tweet)
+    tweet = SEQUENCE_PATTERN.sub(SEQ_REPLACE_PATTERN, tweet)
+    tweet = tweet.replace('/', ' / ')
+    if not tweet.isascii():
+        tweet = _replace_emoji(tweet)
+    tweet = tweet.replace('\r', '').replace('\n', ' ')
+    tweet = MENTION_OR_URL_PATTERN.sub('', tweet)
+    if not tweet.isascii():
+        tweet = NON_ASCII_PATTERN.sub('', tweet)
+    tweet = tweet.translate(BANNED_TABLE).strip()
+    return SPACES_PATTERN.sub(' ', tweet).strip()
+
+
+def _clean_chunk(tweets):
+    return [clean_tweet(tweet) for tweet in tweets]
+
+
+def clean_tweets(tweets, n_jobs=None, chunk_size=20000):
+    '''
+    Clean a sequence of tweets in chunks spread over n_jobs processes (default: all
+    cores). Returns a list in input order.
+    '''
+    tweets = list(tweets)
+    n_jobs = n_jobs or os.cpu_count()
+    if n_jobs == 1 or len(tweets) <= chunk_size:
+        return _clean_chunk(tweets)
+    chunks = [tweets[start:start + chunk_size] for start in range(0, len(tweets), chunk_size)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return [tweet for chunk in executor.map(_clean_chunk, chunks) for tweet in chunk]
+
+
+def word_counts(tweets):
+    return np.fromiter((len(tweet.split()) for tweet in tweets), dtype=np.int32, count=len(tweets))
+
+
+def read_sentiment140(csv_path=DEFAULT_CSV_PATH):
+    '''
+    The label and sentence columns of Sentiment140, with the positive label 4 mapped to 1.
+    '''
+    df = pd.read_csv(csv_path, encoding="ISO-8859-1", header=None, usecols=[0, 5], names=['label', 'sentence'])
+    df['label'] = df['label'].replace({4: 1}).astype(np.int8)
+    return df
+
+
+def balance_labels(df, sample_size, random_state=42):
+    '''
+    sample_size rows of each label, shuffled, as in the notebook.
+    '''
+    sampled = [df[df['label'] == label].sample(n=sample_size, random_state=random_state) for label in (0, 1)]
+    return pd.concat(sampled).sample(frac=1, random_state=random_state).reset_index(drop=True)
+
+
+def load_tokenizer(name=DEFAULT_TOKENIZER):
+    '''
+    The fast (Rust) tokenizer, which encodes a whole batch per call.
+    '''
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(name, use_fast=True)
+
+
+def tokenizer_fingerprint(tokenizer):
+    '''
+    Hash of the full tokenizer definition when it is a fast tokenizer, else its name and size.
+    '''
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    if backend is not None:
+        return hashlib.sha256(backend.to_str().encode('utf-8')).hexdigest()
+    return f"{type(tokenizer).__name__}:{tokenizer.name_or_path}:{len(tokenizer)}"
+
+
+def dataset_key(texts, labels, config):
+    '''
+    Hash of the texts, the labels and the encoding config.
+    '''
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8'))
+    for text in texts:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    if labels is not None:
+        digest.update(np.ascontiguousarray(labels, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+class EncodedTweets:
+    '''
+    input_ids / attention_mask padded to max_length, the unpadded length of each row and
+    the labels, as arrays that are memory-mapped when loaded from the cache.
+    '''
+
+    def __init__(self, input_ids, attention_mask, lengths, labels=None, path=None):
+        self.input_ids = input_ids
+        self.attention_mask = attention_mask
+        self.lengths = lengths
+        self.labels = labels
+        self.path = path
+
+    def __len__(self):
+        return len(self.input_ids)
+
+    @classmethod
+    def load(cls, path):
+        def load(name):
+            file = os.path.join(path, name + '.npy')
+            return np.load(file, mmap_mode='r') if os.path.exists(file) else None
+        return cls(load('input_ids'), load('attention_mask'), load('lengths'), load('labels'), path)
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def encode_texts(texts, tokenizer, path, max_length=DEFAULT_MAX_LENGTH, labels=None, batch_size=10000):
+    '''
+    Encode the texts batch by batch with the fast tokenizer, padded and truncated to
+    max_length as encode_plus(pad_to_max_length=True) did, straight into .npy memmaps
+    in `path`. Returns the EncodedTweets.
+    '''
+    os.makedirs(path, exist_ok=True)
+    n = len(texts)
+    id_dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max else np.int32
+
+    def open_memmap(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+
+    input_ids = open_memmap('input_ids', id_dtype, (n, max_length))
+    attention_mask = open_memmap('attention_mask', np.int8, (n, max_length))
+    lengths = open_memmap('lengths', np.int16, (n,))
+    for start in range(0, n, batch_size):
+        batch = tokenizer(
+            list(texts[start:start + batch_size]),
+            add_special_tokens=True,
+            max_length=max_length,
+            padding='max_length',
+            truncation=True,
+            return_attention_mask=True,
+            return_token_type_ids=False,
+            return_tensors='np',
+        )
+        stop = start + len(batch['input_ids'])
+        input_ids[start:stop] = batch['input_ids']
+        attention_mask[start:stop] = batch['attention_mask']
+        lengths[start:stop] = batch['attention_mask'].sum(axis=1)
+    for array in (input_ids, attention_mask, lengths):
+        array.flush()
+    if labels is not None:
+        np.save(os.path.join(path, 'labels.npy'), np.asarray(labels, dtype=np.int64))
+    return EncodedTweets.load(path)
+
+
+def encode_cached(texts, tokenizer, labels=None, max_length=DEFAULT_MAX_LENGTH, cache_dir=DEFAULT_CACHE_DIR, batch_size=10000):
+    '''
+    Return the EncodedTweets of these texts from cache_dir, encoding them first if this
+    data and config were never encoded. The entry is keyed by a hash of the texts, the
+    labels, max_length and the tokenizer; its manifest is written last, so an
+    interrupted run is encoded again.
+    '''
+    config = {'version': CACHE_VERSION, 'max_length': max_length, 'tokenizer': tokenizer_fingerprint(tokenizer)}
+    key = dataset_key(texts, labels, config)
+    path = os.path.join(cache_dir, key[:24])
+    manifest = _read_manifest(path)
+    if manifest is not None and manifest.get('key') == key:
+        return EncodedTweets.load(path)
+
+    manifest_path = os.path.join(path, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    encoded = encode_texts(texts, tokenizer, path, max_length, labels, batch_size)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'n_rows': len(encoded), **config}, f, indent=2)
+    return encoded
+
+
+class LengthBucketBatchSampler:
+    '''
+    Batches of similar length, for padding each batch only to its own longest row.
+
+    Every epoch the indices are shuffled, cut into buckets of bucket_batches batches,
+    sorted by length inside each bucket and split into batches; the batches are then
+    shuffled again. Pass `indices` to sample a subset (e.g. the training split).
+    Usable as the batch_sampler of a torch DataLoader.
+    '''
+
+    def __init__(self, lengths, batch_size, indices=None, bucket_batches=100, shuffle=True, seed=42, drop_last=False):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.indices = np.arange(len(self.lengths)) if indices is None else np.asarray(indices)
+        self.bucket_size = batch_size * bucket_batches
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.indices) // self.batch_size
+        return -(-len(self.indices) // self.batch_size)
+
+    def batches(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(self.indices) if self.shuffle else self.indices
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        if self.drop_last:
+            batches = [batch for batch in batches if len(batch) == self.batch_size]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        batches = self.batches()
+        self.epoch += 1
+        for batch in batches:
+            yield batch.tolist()
+
+
+def padding_stats(lengths, batches, max_length):
+    '''
+    Share of padded positions when every row is padded to max_length, and when each
+    batch is padded to its longest row.
+    '''
+    lengths = np.asarray(lengths)
+    rows = sum(len(batch) for batch in batches)
+    real = sum(int(lengths[batch].sum()) for batch in batches)
+    bucketed = sum(int(lengths[batch].max()) * len(batch) for batch in batches)
+    if not rows:
+        return {'fixed': 0.0, 'bucketed': 0.0}
+    return {'fixed': 1 - real / (rows * max_length), 'bucketed': 1 - real / bucketed}
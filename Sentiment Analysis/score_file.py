@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import pandas as pd
+
+from serving import DEFAULT_MODEL_DIR, LABELS, SentimentClassifier
+
+
+def read_chunks(path, column, chunk_size, encoding):
+    '''
+    Chunks of a CSV (the text in `column`) or of a text file with one tweet per line.
+    '''
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, encoding=encoding, chunksize=chunk_size)
+        return
+    with open(path, encoding=encoding) as f:
+        lines = []
+        for line in f:
+            lines.append(line.rstrip('\n'))
+            if len(lines) == chunk_size:
+                yield pd.DataFrame({column: lines})
+                lines = []
+        if lines:
+            yield pd.DataFrame({column: lines})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score every tweet in a CSV or text file on CPU.')
+    parser.add_argument('input', help='CSV file, or a text file with one tweet per line.')
+    parser.add_argument('output', help='CSV with the input columns plus label and probability.')
+    parser.add_argument('--column', default='sentence', help='Text column of the input CSV.')
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    parser.add_argument('--fp32', action='store_true', help='Skip int8 quantization.')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows read, sorted by length and written at a time.')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--encoding', default='utf-8')
+    args = parser.parse_args()
+
+    classifier = SentimentClassifier.from_pretrained(args.model_dir, quantize=not args.fp32, num_threads=args.threads,
+                                                     batch_size=args.batch_size)
+    start = time.perf_counter()
+    n_rows = 0
+    for i, chunk in enumerate(read_chunks(args.input, args.column, args.chunk_size, args.encoding)):
+        probabilities = classifier.predict_proba(chunk[args.column].fillna('').astype(str).tolist())
+        chunk['label'] = [LABELS[label] for label in probabilities.argmax(axis=1)]
+        chunk['probability'] = probabilities.max(axis=1)
+        chunk.to_csv(args.output, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"{n_rows:,} tweets scored ({n_rows / elapsed:.0f}/s)")
+    print(f"Wrote '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
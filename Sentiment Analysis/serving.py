@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, BertForSequenceClassification
+
+from instrumentation import stage
+from preprocessing import DEFAULT_MAX_LENGTH, clean_tweet
+
+DEFAULT_MODEL_DIR = 'best_model_save'
+LABELS = ['negative', 'positive']
+
+
+def load_model(model_dir=DEFAULT_MODEL_DIR, quantize=True):
+    '''
+    The fine-tuned model saved by the notebook, in eval mode. With quantize, the weights
+    of every Linear layer are converted to int8 and activations are quantized on the fly
+    (dynamic quantization), which is where nearly all of BERT's CPU time goes.
+    '''
+    model = BertForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class SentimentClassifier:
+    '''
+    Scores tweets on CPU. Texts are cleaned as for training, encoded once without
+    padding, sorted by token count and run in batches of batch_size, each padded only to
+    its own longest tweet. Results come back in input order.
+    '''
+
+    def __init__(self, model, tokenizer, max_length=DEFAULT_MAX_LENGTH, batch_size=64, clean=True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.clean = clean
+
+    @classmethod
+    def from_pretrained(cls, model_dir=DEFAULT_MODEL_DIR, quantize=True, num_threads=None, **kwargs):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        return cls(load_model(model_dir, quantize), tokenizer, **kwargs)
+
+    def predict_proba(self, texts):
+        '''
+        (n, 2) array of negative / positive probabilities.
+        '''
+        texts = [clean_tweet(text) for text in texts] if self.clean else list(texts)
+        probabilities = np.empty((len(texts), len(LABELS)), dtype=np.float32)
+        if not texts:
+            return probabilities
+
+        with stage('tokenize'):
+            input_ids = self.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.max_length)['input_ids']
+        order = np.argsort([len(ids) for ids in input_ids], kind='stable')
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            batch = self.tokenizer.pad({'input_ids': [input_ids[i] for i in rows]}, return_tensors='pt')
+            with stage('forward'), torch.inference_mode():
+                logits = self.model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask']).logits
+            probabilities[rows] = torch.softmax(logits, dim=-1).numpy()
+        return probabilities
+
+    def predict(self, texts):
+        '''
+        The notebook's process_and_predict_sentences output, plus the probability of the label.
+        '''
+        probabilities = self.predict_proba(texts)
+        return [
+            {'Sentence': text, 'label': LABELS[int(p.argmax())], 'probability': float(p.max())}
+            for text, p in zip(texts, probabilities)
+        ]
+
+
+class MicroBatcher:
+    '''
+    Collects tweets submitted from many request threads into batches for one worker
+    thread. A batch is scored as soon as it holds max_batch_size tweets or its first
+    tweet has waited max_latency seconds, whichever comes first.
+    '''
+
+    def __init__(self, classifier, max_batch_size=64, max_latency=0.01):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, text):
+        '''
+        Future resolving to the prediction dict of one tweet.
+        '''
+        future = Future()
+        self._queue.put((time.monotonic(), text, future))
+        return future
+
+    def predict(self, texts, timeout=None):
+        futures = [self.submit(text) for text in texts]
+        return [future.result(timeout) for future in futures]
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[0] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Past the deadline, only take what is already queued
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            futures = [future for _, _, future in batch]
+            try:
+                results = self.classifier.predict([text for _, text, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {'batches': self.batches, 'items': self.items, 'mean_batch_size': self.items / self.batches if self.batches else 0.0}
@@ -0,0 +1,59 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from preprocessing import LengthBucketBatchSampler
+
+
+class EncodedTweetDataset(Dataset):
+    '''
+    Rows of an EncodedTweets, read from the memory-mapped arrays on access.
+    '''
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def __getitem__(self, index):
+        length = int(self.encoded.lengths[index])
+        label = int(self.encoded.labels[index]) if self.encoded.labels is not None else -1
+        return self.encoded.input_ids[index, :length], length, label
+
+
+def collate_dynamic(rows):
+    '''
+    Stack rows into (input_ids, attention_mask, labels) padded to the longest row of the
+    batch instead of max_length, in the order train_epoch expects.
+    '''
+    width = max(length for _, length, _ in rows)
+    input_ids = np.zeros((len(rows), width), dtype=np.int64)
+    attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+    for i, (ids, length, _) in enumerate(rows):
+        input_ids[i, :length] = ids
+        attention_mask[i, :length] = 1
+    labels = torch.tensor([label for _, _, label in rows], dtype=torch.long)
+    return torch.from_numpy(input_ids), torch.from_numpy(attention_mask), labels
+
+
+def split_indices(n, train_fraction=0.9, val_fraction=0.07, seed=42):
+    '''
+    Random train / validation / test indices with the sizes random_split gave in the notebook.
+    '''
+    train_size, val_size = int(train_fraction * n), int(val_fraction * n)
+    permutation = np.random.default_rng(seed).permutation(n)
+    return permutation[:train_size], permutation[train_size:train_size + val_size], permutation[train_size + val_size:]
+
+
+def make_dataloaders(encoded, batch_size=128, bucket_batches=100, seed=42, num_workers=0):
+    '''
+    Train, validation and test DataLoaders over the encoded tweets with length-bucketed,
+    dynamically padded batches. Only the training batches are shuffled.
+    '''
+    dataset = EncodedTweetDataset(encoded)
+    loaders = []
+    for indices, shuffle in zip(split_indices(len(encoded), seed=seed), (True, False, False)):
+        sampler = LengthBucketBatchSampler(encoded.lengths, batch_size, indices, bucket_batches, shuffle, seed)
+        loaders.append(DataLoader(dataset, batch_sampler=sampler, collate_fn=collate_dynamic, num_workers=num_workers))
+    return tuple(loaders)
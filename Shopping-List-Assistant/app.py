@@ -1,104 +1,103 @@
 from flask import Flask, request, jsonify
-import pandas as pd
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-import numpy as np
+
+from ingest import DEFAULT_MERGE_INTERVAL, OrderIngestor
+from instrumentation import count, instrument_flask, stage
+from neighbors import find_similar_users, load_neighbor_table
+from order_store import load_recommender_index, orders_stamp
+from recommendations import load_recommendation_table
 
 app = Flask(__name__)
 
-# Load the dataset
-all_orders_subset = pd.read_csv('Data/all_orders_subset.csv')
+ORDERS_CSV_PATH = 'Data/all_orders_subset.csv'
 
-# Extract unique product_id and product_name mapping
-product_id_to_name = all_orders_subset[['product_id', 'product_name']].drop_duplicates().set_index('product_id')['product_name']
+# Request latency, /metrics and the runtime profiler toggle
+instrument_flask(app)
 
-# Create the user-item matrix
-unique_users = all_orders_subset['user_id'].unique()
-unique_products = all_orders_subset['product_id'].unique()
+# Memory-map the user-item matrix and lookups written by convert_orders.py (falls back to the CSV)
+with stage('load_index'):
+    recommender_index = load_recommender_index(ORDERS_CSV_PATH)
 
-# Create mappings from user_id and product_id to integer indices
-user_id_to_index = {user_id: idx for idx, user_id in enumerate(unique_users)}
-product_id_to_index = {product_id: idx for idx, product_id in enumerate(unique_products)}
+# Within-cluster neighbours precomputed by build_neighbors.py (None -> live KNN only)
+with stage('load_neighbor_table'):
+    neighbor_table = load_neighbor_table(recommender_index.user_ids)
 
-# Map user_id and product_id to their respective indices
-row_indices = all_orders_subset['user_id'].map(user_id_to_index)
-col_indices = all_orders_subset['product_id'].map(product_id_to_index)
+# New orders posted to /orders are merged into a fresh index every DEFAULT_MERGE_INTERVAL seconds
+ingestor = OrderIngestor(recommender_index)
+ingestor.start(DEFAULT_MERGE_INTERVAL)
 
-# Create the sparse user-item matrix
-user_item_matrix_sparse = csr_matrix(
-    (all_orders_subset['reordered'], (row_indices, col_indices)),
-    shape=(len(unique_users), len(unique_products))
+# Recommendations precomputed by bulk_recommend.py (None -> every user is scored live)
+recommendation_table = load_recommendation_table(
+    recommender_index.user_ids, recommender_index.product_ids, orders_stamp(ORDERS_CSV_PATH)
 )
 
-def recommend_products_hybrid(user_id, product_names, all_orders_subset, user_item_matrix_sparse, product_id_to_name, user_id_to_index, top_n=5):
+def recommend_products_hybrid(user_id, product_names, recommender_index, top_n=5, neighbor_table=None, recommendation_table=None):
     """
     Recommends products for a given user using a hybrid approach.
     """
+    user_item_matrix_sparse = recommender_index.user_item_matrix_sparse
+    product_id_to_name = recommender_index.product_id_to_name
+
     # Step 1: Map product names to product IDs
-    product_ids = []
-    for name in product_names:
-        product_id = all_orders_subset[all_orders_subset['product_name'] == name]['product_id'].values
-        if len(product_id) > 0:
-            product_ids.append(product_id[0])
-        else:
-            print(f"Product '{name}' not found in the dataset.")
+    with stage('resolve_products'):
+        product_ids, unknown_names = recommender_index.resolve_product_names(product_names)
+    for name in unknown_names:
+        print(f"Product '{name}' not found in the dataset.")
     
     if not product_ids:
         print("No valid products found. Please check your input.")
-        return []
+        return [], []
     
     # Step 2: Check if the user exists in the subset
-    if user_id not in user_id_to_index:
+    user_index = recommender_index.user_index(user_id)
+    if user_index is None:
         print(f"User ID {user_id} not found in the subset.")
-        return []
+        return [], []
     
     # Step 3: Get the cluster of the target user
-    target_user_cluster = all_orders_subset[all_orders_subset['user_id'] == user_id]['cluster'].values[0]
+    target_user_cluster = recommender_index.cluster_of(user_index)
     print(f"Target user belongs to cluster: {target_user_cluster}")
     
-    # Step 4: Filter the dataset to include only users in the same cluster
-    cluster_users = all_orders_subset[all_orders_subset['cluster'] == target_user_cluster]['user_id'].unique()
-    
-    # Filter the user-item matrix to include only users in the same cluster
-    cluster_user_indices = [user_id_to_index[user] for user in cluster_users if user in user_id_to_index]
-    cluster_user_item_matrix = user_item_matrix_sparse[cluster_user_indices]
-    
-    # Step 5: Find similar users within the cluster using KNN
-    knn = NearestNeighbors(n_neighbors=50, metric='cosine', algorithm='brute')  # Increased n_neighbors
-    knn.fit(cluster_user_item_matrix)
+    # Users with orders merged since the offline tables were built are always scored live
+    if user_id in recommender_index.updated_user_ids:
+        neighbor_table, recommendation_table = None, None
     
-    # Find similar users for the target user
-    user_index = user_id_to_index[user_id]
-    distances, indices = knn.kneighbors(user_item_matrix_sparse[user_index])
-    similar_users = [cluster_users[idx] for idx in indices[0][1:]]  # Exclude the user itself
-    
-    # Step 6: Get products purchased by similar users but not by the target user
-    similar_user_indices = [user_id_to_index[user] for user in similar_users]
-    similar_user_products = user_item_matrix_sparse[similar_user_indices].sum(axis=0)  # Sum across similar users
-    target_user_products = user_item_matrix_sparse[user_index].nonzero()[1]  # Products purchased by the target user
-    
-    # Find new products
-    new_products = set(similar_user_products.nonzero()[1]) - set(target_user_products)
-    print(f"Number of new products: {len(new_products)}")  # Debugging
-    
-    # Step 7: Get top N recommended products
-    recommended_products = list(new_products)[:top_n]
-    
-    # Filter out invalid product IDs
-    valid_recommended_products = [product_id for product_id in recommended_products if product_id in product_id_to_name]
-    print(f"Number of valid recommended products: {len(valid_recommended_products)}")  # Debugging
+    # Served straight from the table written by bulk_recommend.py; cold users are scored live
+    with stage('precomputed_lookup'):
+        precomputed = recommendation_table.lookup(user_id, top_n) if recommendation_table is not None else None
+    if precomputed is not None:
+        count('recommendations_precomputed')
+        valid_recommended_products, recommended_scores = precomputed
+    else:
+        count('recommendations_live')
+        # Step 4: Users in the same cluster (matrix row indices)
+        cluster_user_indices = recommender_index.cluster_members[target_user_cluster]
+        
+        # Step 5: Find similar users within the cluster (precomputed table, or live KNN for users it does not cover)
+        with stage('similar_users'):
+            similar_user_indices, similarities = find_similar_users(
+                user_item_matrix_sparse, neighbor_table, cluster_user_indices, user_index, n_neighbors=49
+            )
+        
+        # Step 6-7: Rank products bought by similar users (weighted by similarity) but not by the target user
+        with stage('rank_products'):
+            recommended_products, scores = recommender_index.rank_new_products(user_index, similar_user_indices, similarities, top_n)
+        valid_recommended_products = recommended_products.tolist()
+        recommended_scores = scores.tolist()
+    print(f"Number of recommended products: {len(valid_recommended_products)}")  # Debugging
     
     # Fallback: Recommend popular products in the cluster if new products are insufficient
     if len(valid_recommended_products) < top_n:
         print("Insufficient new products. Falling back to popular products in the cluster.")
-        cluster_products = all_orders_subset[all_orders_subset['cluster'] == target_user_cluster]['product_id'].value_counts().index.tolist()
-        popular_products = [product_id for product_id in cluster_products if product_id in product_id_to_name]
-        valid_recommended_products.extend(popular_products[:top_n - len(valid_recommended_products)])
+        count('recommendations_popularity_fallback')
+        popular_products = recommender_index.cluster_popularity[target_user_cluster]
+        popular_products = popular_products[:top_n - len(valid_recommended_products)].tolist()
+        valid_recommended_products.extend(popular_products)
+        recommended_scores.extend([0.0] * len(popular_products))
     
     # Map product IDs to product names
     recommended_product_names = [product_id_to_name[product_id] for product_id in valid_recommended_products]
     
-    return recommended_product_names
+    return recommended_product_names, recommended_scores
 
 # Define the API endpoint
 @app.route('/recommend', methods=['POST'])
@@ -114,23 +113,43 @@ def recommend():
         product_names = [name.strip() for name in product_names]
         
         # Get recommendations
-        recommended_products = recommend_products_hybrid(
+        recommended_products, scores = recommend_products_hybrid(
             user_id=user_id,
             product_names=product_names,
-            all_orders_subset=all_orders_subset,
-            user_item_matrix_sparse=user_item_matrix_sparse,
-            product_id_to_name=product_id_to_name,
-            user_id_to_index=user_id_to_index,
+            recommender_index=ingestor.current,  # read once: a merge swaps in a new index
+            neighbor_table=neighbor_table,
+            recommendation_table=recommendation_table,
             top_n=top_n  # Pass the user-specified top_n
         )
         
         if recommended_products:
-            return jsonify({"user_id": user_id, "recommended_products": recommended_products})
+            return jsonify({"user_id": user_id, "recommended_products": recommended_products, "scores": scores})
         else:
             return jsonify({"user_id": user_id, "message": "No recommendations available."})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Append new order rows; they are served after the next scheduled merge
+@app.route('/orders', methods=['POST'])
+def add_orders():
+    try:
+        data = request.get_json()
+        pending = ingestor.add_orders(data.get('orders', []))
+        return jsonify({"pending_rows": pending, "last_merge": ingestor.last_merge})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Merge pending order rows now instead of waiting for the schedule
+@app.route('/orders/merge', methods=['POST'])
+def merge_orders():
+    try:
+        merge = ingestor.merge()
+        return jsonify({"merged": merge is not None, "last_merge": ingestor.last_merge})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Run the Flask app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import OrderIngestor
+from recommender_index import RecommenderIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare merging new orders into the index against a full rebuild.')
+    parser.add_argument('--data', default='Data/all_orders_subset.csv')
+    parser.add_argument('--new-fraction', type=float, default=0.01, help='Trailing share of the rows replayed as new orders.')
+    parser.add_argument('--batches', type=int, default=10, help='Merges the new rows are split into.')
+    args = parser.parse_args()
+
+    all_orders_subset = pd.read_csv(args.data)
+    split = int(len(all_orders_subset) * (1 - args.new_fraction))
+    base_orders, new_orders = all_orders_subset.iloc[:split], all_orders_subset.iloc[split:]
+
+    base_index = RecommenderIndex.build(base_orders)
+    ingestor = OrderIngestor(base_index)
+    merge_times = []
+    for batch in np.array_split(np.arange(len(new_orders)), args.batches):
+        ingestor.add_orders(new_orders.iloc[batch])
+        start = time.perf_counter()
+        ingestor.merge()
+        merge_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    rebuilt = RecommenderIndex.build(all_orders_subset)
+    rebuild_time = time.perf_counter() - start
+
+    merged = ingestor.current
+    same_rows = np.array_equal(merged.user_ids, rebuilt.user_ids) and np.array_equal(merged.product_ids, rebuilt.product_ids)
+    same_matrix = same_rows and (merged.user_item_matrix_sparse != rebuilt.user_item_matrix_sparse).nnz == 0
+
+    print(f"Replayed {len(new_orders)} of {len(all_orders_subset)} rows in {args.batches} merges "
+          f"({len(merged.user_ids) - len(base_index.user_ids)} new users, "
+          f"{len(merged.product_ids) - len(base_index.product_ids)} new products)")
+    print(f"Merge:        mean {np.mean(merge_times) * 1000:.1f} ms, max {np.max(merge_times) * 1000:.1f} ms per batch")
+    print(f"Full rebuild: {rebuild_time * 1000:.1f} ms ({rebuild_time / np.mean(merge_times):.0f}x a merge)")
+    print(f"Merged index matches the rebuild: {same_matrix}")
+
+
+if __name__ == "__main__":
+    main()
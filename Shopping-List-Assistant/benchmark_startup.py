@@ -0,0 +1,70 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from order_store import DEFAULT_CSV_PATH, default_store_dir, load_store
+from recommender_index import RecommenderIndex
+
+
+def rss_mb():
+    '''
+    Current resident set size of this process in MB.
+    '''
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def measure(path, csv_path, store_dir):
+    '''
+    Load the index the way the apps do and report startup time and memory. Run in a
+    fresh process per path so neither benefits from the other's imports or heap.
+    '''
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if path == 'csv':
+        recommender_index = RecommenderIndex.build(pd.read_csv(csv_path))
+    else:
+        recommender_index = load_store(store_dir)
+    elapsed = time.perf_counter() - start
+    # Touch one user's row so the store path pays for the pages a first request needs
+    recommender_index.owned_products(0)
+    return {
+        'seconds': elapsed,
+        'rss_mb': rss_mb() - baseline,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare app startup from the CSV and from the converted store.')
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH)
+    parser.add_argument('--store', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', choices=['csv', 'store'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    store_dir = args.store or default_store_dir(args.csv)
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.csv, store_dir)))
+        return
+
+    for path in ['csv', 'store']:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, __file__, '--csv', args.csv, '--store', store_dir, '--child', path],
+                check=True, capture_output=True, text=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run['seconds'])
+        print(f"{path:>5}: load {best['seconds'] * 1000:8.1f} ms, RSS +{best['rss_mb']:7.1f} MB, "
+              f"peak process RSS {best['peak_rss_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import time
+
+from neighbors import DEFAULT_N_NEIGHBORS, DEFAULT_TABLE_DIR, compute_neighbor_table, save_neighbor_table
+from order_store import load_recommender_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute within-cluster user neighbours for the recommender.')
+    parser.add_argument('--data', default='Data/all_orders_subset.csv')
+    parser.add_argument('--out', default=DEFAULT_TABLE_DIR)
+    parser.add_argument('--neighbors', type=int, default=DEFAULT_N_NEIGHBORS, help='Neighbours kept per user.')
+    parser.add_argument('--block-size', type=int, default=1024, help='Users scored per block.')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker threads (default: all cores).')
+    args = parser.parse_args()
+
+    recommender_index = load_recommender_index(args.data)
+    user_ids = recommender_index.user_ids
+    clusters = recommender_index.cluster_members
+
+    start = time.perf_counter()
+    neighbors, similarities = compute_neighbor_table(
+        recommender_index.user_item_matrix_sparse, clusters, n_neighbors=args.neighbors, block_size=args.block_size, n_jobs=args.jobs
+    )
+    elapsed = time.perf_counter() - start
+    save_neighbor_table(args.out, user_ids, neighbors, similarities)
+
+    print(f"Computed {args.neighbors} neighbours for {len(user_ids)} users in {len(clusters)} clusters "
+          f"in {elapsed:.2f}s ({len(user_ids) / elapsed:.0f} users/s), saved to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from neighbors import DEFAULT_N_NEIGHBORS, DEFAULT_TABLE_DIR as DEFAULT_NEIGHBOR_DIR, compute_neighbor_table, load_neighbor_table
+from order_store import load_recommender_index, orders_stamp
+from recommendations import DEFAULT_TABLE_DIR, bulk_recommend, save_recommendation_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute recommendations for every user of the selected clusters.')
+    parser.add_argument('--data', default='Data/all_orders_subset.csv')
+    parser.add_argument('--neighbors-dir', default=DEFAULT_NEIGHBOR_DIR)
+    parser.add_argument('--out', default=DEFAULT_TABLE_DIR)
+    parser.add_argument('--clusters', type=int, nargs='*', default=None, help='Clusters to score (default: all).')
+    parser.add_argument('--top-n', type=int, default=10, help='Products stored per user.')
+    parser.add_argument('--block-size', type=int, default=2048, help='Users scored per sparse product.')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: all cores).')
+    args = parser.parse_args()
+
+    recommender_index = load_recommender_index(args.data)
+
+    neighbor_table = load_neighbor_table(recommender_index.user_ids, args.neighbors_dir)
+    if neighbor_table is not None:
+        neighbors, similarities = neighbor_table.neighbors, neighbor_table.similarities
+    else:
+        print("Computing the neighbour table first...")
+        neighbors, similarities = compute_neighbor_table(
+            recommender_index.user_item_matrix_sparse, recommender_index.cluster_members,
+            n_neighbors=DEFAULT_N_NEIGHBORS, n_jobs=args.jobs
+        )
+
+    clusters = args.clusters if args.clusters else [int(cluster) for cluster in recommender_index.cluster_members]
+    user_indices = pd.unique(np.concatenate([recommender_index.cluster_members[cluster] for cluster in clusters]))
+    n_jobs = args.jobs or os.cpu_count()
+
+    start = time.perf_counter()
+    columns, scores = bulk_recommend(
+        recommender_index.user_item_matrix_sparse, neighbors, similarities, user_indices,
+        top_n=args.top_n, block_size=args.block_size, n_jobs=n_jobs
+    )
+    elapsed = time.perf_counter() - start
+
+    product_ids = np.where(columns >= 0, recommender_index.product_ids[columns], -1).astype(np.int32)
+    save_recommendation_table(args.out, recommender_index.user_ids[user_indices], product_ids, scores,
+                              recommender_index.user_ids, recommender_index.product_ids, orders_stamp(args.data))
+
+    throughput = len(user_indices) / elapsed
+    print(f"Scored {len(user_indices)} users from clusters {clusters} in {elapsed:.2f}s "
+          f"with {n_jobs} processes: {throughput:.0f} users/s, {throughput / n_jobs:.0f} users/s per core")
+    print(f"Saved top-{args.top_n} recommendations to '{args.out}'")
+
+
+if __name__ == "__main__":
+    main()
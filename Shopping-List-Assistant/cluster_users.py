@@ -0,0 +1,61 @@
+import argparse
+import os
+import resource
+import time
+
+import pandas as pd
+
+from clustering import (DEFAULT_CHUNK_SIZE, DEFAULT_DATA_DIR, Lookups, aisle_counts, aisle_shares, fit_kmeans,
+                        reduce_dimensions, sweep_k, write_all_orders_cluster)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster users by aisle share without loading the order rows into memory.')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--out', default='Data/all_orders_cluster.csv')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Order rows read per chunk.')
+    parser.add_argument('--block-size', type=int, default=8192, help='Users densified per PCA / k-means batch.')
+    parser.add_argument('--variance', type=float, default=0.80, help='Variance the PCA components must explain.')
+    parser.add_argument('--k-min', type=int, default=5)
+    parser.add_argument('--k-max', type=int, default=29)
+    parser.add_argument('--k', type=int, default=16, help='Number of clusters written to the output.')
+    parser.add_argument('--epochs', type=int, default=3, help='Passes over the users per k-means fit.')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes for the k sweep (default: all cores).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    lookups = Lookups(args.data_dir)
+    user_ids, counts = aisle_counts(lookups, args.data_dir, args.chunk_size)
+    shares = aisle_shares(counts)
+    print(f"Aisle shares for {len(user_ids)} users x {shares.shape[1]} aisles ({shares.nnz} non-zero) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    features_path = os.path.splitext(args.out)[0] + '_features.npy'
+    n_components, explained = reduce_dimensions(shares, features_path, args.variance, args.block_size)
+    print(f"{n_components} components explain {explained:.1%} of the variance ({time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    sweep = sweep_k(features_path, range(args.k_min, args.k_max + 1), args.block_size, args.epochs, args.jobs)
+    print(f"Fitted k={args.k_min}..{args.k_max} in {time.perf_counter() - start:.1f}s")
+    sse = pd.Series({k: inertia for k, (inertia, _) in sweep.items()})
+    print(pd.DataFrame({'SSE': sse, 'pct_change': sse.pct_change()}).to_string())
+
+    if args.k in sweep:
+        labels = sweep[args.k][1]
+    else:
+        _, _, labels = fit_kmeans(features_path, args.k, args.block_size, args.epochs)
+
+    start = time.perf_counter()
+    pd.DataFrame({'user_id': user_ids, 'cluster': labels}).to_csv(os.path.splitext(args.out)[0] + '_users.csv', index=False)
+    n_rows = write_all_orders_cluster(lookups, user_ids, labels, args.out, args.data_dir, args.chunk_size)
+    print(f"Wrote {n_rows} rows with k={args.k} to '{args.out}' in {time.perf_counter() - start:.1f}s")
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import normalize
+
+DEFAULT_DATA_DIR = 'Data'
+ORDER_PRODUCT_FILES = ['order_products__prior.csv', 'order_products__train.csv']
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+ORDER_PRODUCT_DTYPES = {'order_id': np.int32, 'product_id': np.int32, 'add_to_cart_order': np.int16, 'reordered': np.int8}
+
+
+class Lookups:
+    """
+    The small Instacart tables, plus dense arrays indexed by order_id / product_id so a
+    chunk of order_products is joined with a gather instead of three merges.
+
+    A product only maps to an aisle if its aisle and department exist, which keeps the
+    rows of the notebook's inner merges.
+    """
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR):
+        self.orders = pd.read_csv(os.path.join(data_dir, 'orders.csv'), usecols=['order_id', 'user_id'], dtype=np.int32)
+        self.products = pd.read_csv(os.path.join(data_dir, 'products.csv'))
+        self.aisles = pd.read_csv(os.path.join(data_dir, 'aisles.csv'))
+        self.departments = pd.read_csv(os.path.join(data_dir, 'departments.csv'))
+
+        self.order_user = np.full(self.orders['order_id'].max() + 1, -1, dtype=np.int32)
+        self.order_user[self.orders['order_id'].to_numpy()] = self.orders['user_id'].to_numpy()
+
+        # Users as rows in user_id order, as pivot() sorts its index
+        self.user_ids = np.unique(self.orders['user_id'].to_numpy())
+        self.user_row = np.full(self.user_ids.max() + 1, -1, dtype=np.int32)
+        self.user_row[self.user_ids] = np.arange(len(self.user_ids), dtype=np.int32)
+
+        # Aisles as columns in name order, as pivot() sorts its columns
+        self.aisle_names = np.sort(self.aisles['aisle'].unique())
+        aisle_column = dict(zip(self.aisle_names.tolist(), range(len(self.aisle_names))))
+        aisle_columns = self.aisles.set_index('aisle_id')['aisle'].map(aisle_column)
+
+        joinable = self.products[
+            self.products['aisle_id'].isin(self.aisles['aisle_id']) & self.products['department_id'].isin(self.departments['department_id'])
+        ]
+        self.product_aisle = np.full(self.products['product_id'].max() + 1, -1, dtype=np.int32)
+        self.product_aisle[joinable['product_id'].to_numpy()] = aisle_columns.reindex(joinable['aisle_id']).to_numpy()
+
+    def join(self, chunk):
+        '''
+        (keep mask, user rows, aisle columns) of a chunk of order_products rows.
+        '''
+        order_ids, product_ids = chunk['order_id'].to_numpy(), chunk['product_id'].to_numpy()
+        users = np.where(order_ids < len(self.order_user), self.order_user[np.minimum(order_ids, len(self.order_user) - 1)], -1)
+        aisles = np.where(product_ids < len(self.product_aisle), self.product_aisle[np.minimum(product_ids, len(self.product_aisle) - 1)], -1)
+        keep = (users >= 0) & (aisles >= 0)
+        return keep, self.user_row[users[keep]], aisles[keep]
+
+
+def iter_order_products(data_dir=DEFAULT_DATA_DIR, chunk_size=DEFAULT_CHUNK_SIZE):
+    for name in ORDER_PRODUCT_FILES:
+        yield from pd.read_csv(os.path.join(data_dir, name), dtype=ORDER_PRODUCT_DTYPES, chunksize=chunk_size)
+
+
+def aisle_counts(lookups, data_dir=DEFAULT_DATA_DIR, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Products bought per (user, aisle), accumulated chunk by chunk into a sparse matrix.
+    Returns (user_ids, counts) with only the users that bought something.
+    '''
+    shape = (len(lookups.user_ids), len(lookups.aisle_names))
+    counts = csr_matrix(shape, dtype=np.int32)
+    for chunk in iter_order_products(data_dir, chunk_size):
+        _, rows, columns = lookups.join(chunk)
+        counts = counts + csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=shape)
+
+    active = np.diff(counts.indptr) > 0
+    return lookups.user_ids[active], counts[active]
+
+
+def aisle_shares(counts):
+    '''
+    Share of each user's products that come from each aisle (rows sum to one).
+    '''
+    return normalize(counts.astype(np.float64), norm='l1', axis=1)
+
+
+def _row_blocks(n_rows, block_size):
+    '''
+    [start, stop) row blocks of block_size, the last one absorbing the remainder so no
+    block is smaller than block_size (IncrementalPCA needs n_components rows per batch).
+    '''
+    starts = list(range(0, n_rows, block_size))
+    if len(starts) > 1 and n_rows - starts[-1] < block_size:
+        starts.pop()
+    return list(zip(starts, starts[1:] + [n_rows]))
+
+
+def reduce_dimensions(shares, features_path, variance=0.80, block_size=8192):
+    '''
+    Standardize the aisle shares and project them on the principal components that
+    explain `variance` of the variance, as StandardScaler + PCA in the notebook.
+
+    The scaler statistics come straight from the sparse matrix and the PCA is fitted
+    with IncrementalPCA, so only block_size rows are ever dense. The projection is
+    written to a .npy memmap at features_path. Returns (n_components, explained ratio).
+    '''
+    n_users, n_aisles = shares.shape
+    block_size = max(block_size, n_aisles)
+    mean = np.asarray(shares.mean(axis=0)).ravel()
+    std = np.sqrt(np.asarray(shares.multiply(shares).mean(axis=0)).ravel() - mean ** 2)
+    std[std == 0] = 1.0
+
+    blocks = _row_blocks(n_users, block_size)
+    pca = IncrementalPCA(n_components=min(n_aisles, n_users))
+    for start, stop in blocks:
+        pca.partial_fit((shares[start:stop].toarray() - mean) / std)
+
+    cumsum = np.cumsum(pca.explained_variance_ratio_)
+    n_components = int(np.argmax(cumsum >= variance) + 1)
+    components = pca.components_[:n_components]
+
+    features = np.lib.format.open_memmap(features_path, mode='w+', dtype=np.float32, shape=(n_users, n_components))
+    for start, stop in blocks:
+        features[start:stop] = ((shares[start:stop].toarray() - mean) / std - pca.mean_) @ components.T
+    features.flush()
+    return n_components, float(cumsum[n_components - 1])
+
+
+def fit_kmeans(features_path, k, block_size=8192, epochs=3, random_state=42):
+    '''
+    MiniBatchKMeans over the memory-mapped features, fed block by block for `epochs`
+    passes. Returns (k, inertia, int16 labels).
+    '''
+    features = np.load(features_path, mmap_mode='r')
+    blocks = _row_blocks(len(features), max(block_size, 3 * k))
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=block_size, n_init=3)
+    for _ in range(epochs):
+        for start, stop in blocks:
+            kmeans.partial_fit(features[start:stop])
+
+    inertia = 0.0
+    labels = np.empty(len(features), dtype=np.int16)
+    for start, stop in blocks:
+        block = np.asarray(features[start:stop])
+        labels[start:stop] = kmeans.predict(block)
+        inertia -= kmeans.score(block)
+    return k, inertia, labels
+
+
+def sweep_k(features_path, ks, block_size=8192, epochs=3, n_jobs=None):
+    '''
+    Fit every k in ks in parallel processes. Returns {k: (inertia, labels)}.
+    '''
+    ks = list(ks)
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        results = executor.map(fit_kmeans, [features_path] * len(ks), ks, [block_size] * len(ks), [epochs] * len(ks))
+        return {k: (inertia, labels) for k, inertia, labels in results}
+
+
+def write_all_orders_cluster(lookups, user_ids, labels, out_path, data_dir=DEFAULT_DATA_DIR, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Stream the order rows again, join them with users, products, departments, aisles and
+    the cluster of each user, and append them to out_path chunk by chunk. Produces the
+    columns of the notebook's all_orders_cluster. Returns the number of rows written.
+    '''
+    cluster_of_row = np.full(len(lookups.user_ids), -1, dtype=np.int16)
+    cluster_of_row[lookups.user_row[user_ids]] = labels
+
+    products = lookups.products.set_index('product_id')
+    departments = lookups.departments.set_index('department_id')['department']
+    aisles = lookups.aisles.set_index('aisle_id')['aisle']
+
+    n_rows = 0
+    for i, chunk in enumerate(iter_order_products(data_dir, chunk_size)):
+        keep, rows, _ = lookups.join(chunk)
+        chunk = chunk[keep]
+        chunk.insert(len(chunk.columns), 'user_id', lookups.user_ids[rows])
+        chunk = chunk.join(products, on='product_id')
+        chunk['department'] = departments.reindex(chunk['department_id']).to_numpy()
+        chunk['aisle'] = aisles.reindex(chunk['aisle_id']).to_numpy()
+        chunk['cluster'] = cluster_of_row[rows]
+        chunk.to_csv(out_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(chunk)
+    return n_rows
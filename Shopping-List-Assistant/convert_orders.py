@@ -0,0 +1,21 @@
+import argparse
+import time
+
+from order_store import DEFAULT_CSV_PATH, convert_orders, read_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the order CSV into the memory-mapped store the apps load at startup.')
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH)
+    parser.add_argument('--out', default=None, help='Store directory (default: next to the CSV).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store_dir = convert_orders(args.csv, args.out)
+    manifest = read_manifest(store_dir)
+    print(f"Converted {manifest['n_rows']} rows ({manifest['n_users']} users, {manifest['n_products']} products) "
+          f"in {time.perf_counter() - start:.2f}s, saved to '{store_dir}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from instrumentation import stage
+from recommender_index import RecommenderIndex
+
+# Columns of all_orders_subset the recommender is built from
+ORDER_COLUMNS = ['user_id', 'product_id', 'product_name', 'reordered', 'cluster']
+
+DEFAULT_MERGE_INTERVAL = 60
+
+
+class OrderDelta:
+    """
+    Order rows received since the last merge. Appending only takes a short lock, so
+    ingestion never waits for a merge in progress.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = []
+        self._n_rows = 0
+
+    def __len__(self):
+        return self._n_rows
+
+    def append(self, orders):
+        '''
+        Validate and buffer new order rows (a DataFrame or a list of dicts with the
+        all_orders_subset columns). Returns the number of rows now pending.
+        '''
+        orders = pd.DataFrame(orders)
+        missing = [column for column in ORDER_COLUMNS if column not in orders.columns]
+        if missing:
+            raise ValueError(f"Order rows are missing columns: {missing}")
+        orders = orders[ORDER_COLUMNS].astype({'user_id': 'int64', 'product_id': 'int64', 'reordered': 'int64', 'cluster': 'int64'})
+
+        with self._lock:
+            self._frames.append(orders)
+            self._n_rows += len(orders)
+            return self._n_rows
+
+    def drain(self):
+        '''
+        Take every pending row, or None if there are none.
+        '''
+        with self._lock:
+            frames, self._frames, self._n_rows = self._frames, [], 0
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+
+def _codes(values, known_index, n_known):
+    '''
+    Row / column of every value: its existing position, or a new one appended after
+    n_known in order of first appearance. Returns (codes, new values).
+    '''
+    values = values.to_numpy()
+    codes = np.fromiter((known_index.get(value, -1) for value in values.tolist()), dtype=np.int64, count=len(values))
+    unknown = codes < 0
+    new_codes, new_values = pd.factorize(values[unknown])
+    codes[unknown] = n_known + new_codes
+    return codes, np.asarray(new_values)
+
+
+def merge_orders(recommender_index, new_orders):
+    '''
+    Return a new RecommenderIndex with new_orders added, without touching the old one
+    (requests still holding it keep a consistent view).
+
+    New users and products get the next rows / columns, so existing indices stay valid.
+    The matrix is grown by extending indptr and the delta is added as one sparse sum,
+    which is linear in the stored entries instead of re-reading every order row.
+    Popularity counts are updated instead of re-running value_counts() over the cluster.
+    '''
+    old_matrix = recommender_index.user_item_matrix_sparse
+    user_codes, new_user_ids = _codes(new_orders['user_id'], recommender_index.user_id_to_index, len(recommender_index.user_ids))
+    product_codes, new_product_ids = _codes(new_orders['product_id'], recommender_index.product_id_to_index, len(recommender_index.product_ids))
+
+    user_ids = np.concatenate([recommender_index.user_ids, new_user_ids.astype(recommender_index.user_ids.dtype)])
+    product_ids = np.concatenate([recommender_index.product_ids, new_product_ids.astype(recommender_index.product_ids.dtype)])
+    shape = (len(user_ids), len(product_ids))
+
+    indptr = np.concatenate([old_matrix.indptr, np.full(len(new_user_ids), old_matrix.indptr[-1], dtype=old_matrix.indptr.dtype)])
+    grown_matrix = csr_matrix((old_matrix.data, old_matrix.indices, indptr), shape=shape)
+    delta_matrix = csr_matrix((new_orders['reordered'].to_numpy(), (user_codes, product_codes)), shape=shape)
+    user_item_matrix_sparse = (grown_matrix + delta_matrix).tocsr()
+
+    # Names of new products and newly seen product names (first row wins, as in build)
+    new_product_rows = new_orders.drop_duplicates('product_id').set_index('product_id')
+    product_names = np.concatenate([
+        recommender_index.product_names, new_product_rows['product_name'].reindex(new_product_ids).to_numpy()
+    ])
+    name_to_product_id = dict(recommender_index.name_to_product_id)
+    for name, product_id in new_orders[['product_name', 'product_id']].drop_duplicates('product_name').itertuples(index=False):
+        name_to_product_id.setdefault(name, product_id)
+
+    # New users take the cluster of their first order row
+    first_new_rows = new_orders[user_codes >= len(recommender_index.user_ids)].drop_duplicates('user_id')
+    user_clusters = np.concatenate([
+        recommender_index.user_clusters,
+        first_new_rows['cluster'].to_numpy().astype(recommender_index.user_clusters.dtype),
+    ])
+
+    cluster_members = dict(recommender_index.cluster_members)
+    cluster_popularity = dict(recommender_index.cluster_popularity)
+    cluster_popularity_counts = dict(recommender_index.cluster_popularity_counts)
+    clusters = new_orders['cluster'].to_numpy()
+    for cluster in np.unique(clusters):
+        in_cluster = clusters == cluster
+        members = cluster_members.get(cluster, np.empty(0, dtype=np.int32))
+        joined = pd.unique(user_codes[in_cluster])
+        joined = joined[~np.isin(joined, members)]
+        cluster_members[cluster] = np.concatenate([members, joined.astype(np.int32)])
+
+        # Products with equal counts keep their previous order (stable sort)
+        popularity = pd.Index(cluster_popularity.get(cluster, np.empty(0, dtype=product_ids.dtype)))
+        new_counts = new_orders['product_id'][in_cluster].value_counts()
+        products = popularity.append(new_counts.index.difference(popularity, sort=False))
+        counts = np.zeros(len(products), dtype=np.int64)
+        counts[:len(popularity)] = cluster_popularity_counts.get(cluster, 0)
+        counts += new_counts.reindex(products, fill_value=0).to_numpy()
+        order = np.argsort(-counts, kind='stable')
+        cluster_popularity[cluster] = products.to_numpy()[order]
+        cluster_popularity_counts[cluster] = counts[order]
+
+    updated_user_ids = recommender_index.updated_user_ids | frozenset(new_orders['user_id'].tolist())
+
+    return RecommenderIndex(user_ids, product_ids, product_names, user_item_matrix_sparse, user_clusters,
+                            cluster_members, cluster_popularity, cluster_popularity_counts, name_to_product_id,
+                            updated_user_ids=updated_user_ids)
+
+
+class OrderIngestor:
+    """
+    Owns the live RecommenderIndex and folds buffered order rows into it.
+
+    A merge builds a complete new index next to the live one and publishes it with a
+    single reference assignment, so requests read `ingestor.current` once and are never
+    blocked or handed a half-updated index.
+    """
+
+    def __init__(self, recommender_index):
+        self.current = recommender_index
+        self.delta = OrderDelta()
+        self.last_merge = None
+        self._merge_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_orders(self, orders):
+        return self.delta.append(orders)
+
+    def merge(self):
+        '''
+        Merge the pending rows now. Returns merge statistics, or None if nothing was pending.
+        '''
+        with self._merge_lock:
+            new_orders = self.delta.drain()
+            if new_orders is None:
+                return None
+            with stage('merge_orders') as timer:
+                merged = merge_orders(self.current, new_orders)
+            elapsed = timer.elapsed
+            self.current = merged
+            self.last_merge = {
+                'rows': len(new_orders),
+                'users': len(merged.user_ids),
+                'products': len(merged.product_ids),
+                'seconds': round(elapsed, 4),
+            }
+            return self.last_merge
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                merge = self.merge()
+            except Exception as e:
+                print(f"Merging new orders failed: {e}")
+                continue
+            if merge is not None:
+                print(f"Merged {merge['rows']} order rows in {merge['seconds']:.3f}s")
+
+    def start(self, interval=DEFAULT_MERGE_INTERVAL):
+        '''
+        Merge pending rows every interval seconds in a daemon thread.
+        '''
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,200 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
+
+from instrumentation import stage
+
+DEFAULT_TABLE_DIR = 'Data/neighbors'
+
+# The API fits NearestNeighbors(n_neighbors=50) and drops the user itself
+DEFAULT_N_NEIGHBORS = 49
+
+# Cluster members scored per sparse product in _block_neighbors (block_size x this many floats)
+DEFAULT_COLUMN_BLOCK_SIZE = 2048
+
+
+def _neighbor_keys(similarities, positions):
+    '''
+    uint64 keys that sort by similarity descending, then position ascending: the float32
+    bits mapped to an order-preserving integer in the high half, the position in the
+    low half. Every key is unique, so a partition on them picks an exact top k.
+    '''
+    bits = np.ascontiguousarray(similarities, dtype=np.float32).view(np.int32)
+    ordered = bits ^ ((bits >> 31) & 0x7FFFFFFF)  # ascends with the float value
+    keys = np.empty(similarities.shape, dtype=np.uint64)
+    np.subtract(np.int64(0x7FFFFFFF), ordered, out=keys, casting='unsafe')
+    keys <<= np.uint64(32)
+    keys |= positions.astype(np.uint64)
+    return keys
+
+
+def _select_top_k(similarities, positions, k):
+    '''
+    Column indices of the k highest similarities of each row, the lowest positions
+    among those tied with the k-th. Unordered.
+    '''
+    selected = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    kth = np.take_along_axis(similarities, selected, axis=1).min(axis=1)
+    # Rows where more values tie with the k-th than fit: argpartition picked any of them
+    ties = np.flatnonzero((similarities >= kth[:, None]).sum(axis=1) > k)
+    if len(ties):
+        selected[ties] = np.argpartition(_neighbor_keys(similarities[ties], positions[ties]), k - 1, axis=1)[:, :k]
+    return selected
+
+
+def _block_neighbors(normalized_matrix, members, start, stop, n_neighbors, column_block_size=DEFAULT_COLUMN_BLOCK_SIZE):
+    '''
+    Top n_neighbors most similar users (cosine) of members[start:stop] among members,
+    most similar first, lowest member position first among equals. The user itself is
+    never returned.
+
+    The cluster is scanned column_block_size members at a time and merged into a running
+    top n_neighbors per row, so memory does not grow with the size of the cluster.
+    '''
+    n_rows = stop - start
+    k = min(n_neighbors, len(members) - 1)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int32), np.empty((n_rows, 0), dtype=np.float32)
+
+    block = normalized_matrix[members[start:stop]]
+    own_positions = np.arange(start, stop)
+    best_similarities = np.empty((n_rows, 0), dtype=np.float32)
+    best_positions = np.empty((n_rows, 0), dtype=np.int64)
+    for column_start in range(0, len(members), column_block_size):
+        column_stop = min(column_start + column_block_size, len(members))
+        similarities = (block @ normalized_matrix[members[column_start:column_stop]].T).toarray().astype(np.float32, copy=False)
+        inside = (own_positions >= column_start) & (own_positions < column_stop)
+        similarities[np.flatnonzero(inside), own_positions[inside] - column_start] = -np.inf
+
+        similarities = np.concatenate([best_similarities, similarities], axis=1)
+        positions = np.concatenate([
+            best_positions, np.broadcast_to(np.arange(column_start, column_stop), (n_rows, column_stop - column_start))
+        ], axis=1)
+        if similarities.shape[1] > k:
+            selected = _select_top_k(similarities, positions, k)
+            similarities = np.take_along_axis(similarities, selected, axis=1)
+            positions = np.take_along_axis(positions, selected, axis=1)
+        best_similarities, best_positions = similarities, positions
+
+    order = np.lexsort((best_positions, -best_similarities), axis=1)
+    return members[np.take_along_axis(best_positions, order, axis=1)], np.take_along_axis(best_similarities, order, axis=1)
+
+
+def compute_neighbor_table(user_item_matrix_sparse, clusters, n_neighbors=DEFAULT_N_NEIGHBORS, block_size=1024, n_jobs=None,
+                           column_block_size=DEFAULT_COLUMN_BLOCK_SIZE):
+    '''
+    Compute the top n_neighbors neighbours of every user within its own cluster.
+
+    Rows are L2-normalized once so cosine similarity is a sparse product, evaluated for
+    block_size users against column_block_size members at a time, so each of the n_jobs
+    threads holds at most block_size x (column_block_size + n_neighbors) similarities
+    (the sparse products and partitions run outside the GIL).
+
+    Returns (neighbors, similarities): int32 row indices padded with -1 and float32
+    cosine similarities, both of shape (n_users, n_neighbors).
+    '''
+    n_users = user_item_matrix_sparse.shape[0]
+    normalized_matrix = normalize(user_item_matrix_sparse.astype(np.float32), norm='l2', axis=1).tocsr()
+
+    neighbors = np.full((n_users, n_neighbors), -1, dtype=np.int32)
+    similarities = np.zeros((n_users, n_neighbors), dtype=np.float32)
+
+    tasks = [
+        (members, start, min(start + block_size, len(members)))
+        for members in clusters.values()
+        for start in range(0, len(members), block_size)
+    ]
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        futures = [
+            (members[start:stop], executor.submit(
+                _block_neighbors, normalized_matrix, members, start, stop, n_neighbors, column_block_size
+            ))
+            for members, start, stop in tasks
+        ]
+        for rows, future in futures:
+            block_neighbors, block_similarities = future.result()
+            k = block_neighbors.shape[1]
+            neighbors[rows, :k] = block_neighbors
+            similarities[rows, :k] = block_similarities
+    return neighbors, similarities
+
+
+def save_neighbor_table(table_dir, user_ids, neighbors, similarities):
+    os.makedirs(table_dir, exist_ok=True)
+    np.save(os.path.join(table_dir, 'user_ids.npy'), np.asarray(user_ids))
+    np.save(os.path.join(table_dir, 'neighbors.npy'), neighbors)
+    np.save(os.path.join(table_dir, 'similarities.npy'), similarities)
+
+
+class NeighborTable:
+    """
+    Precomputed within-cluster neighbours, indexed by user-item matrix row.
+    """
+
+    def __init__(self, neighbors, similarities):
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+    @property
+    def n_neighbors(self):
+        return self.neighbors.shape[1]
+
+    def lookup(self, user_index, n_neighbors):
+        '''
+        Return (row indices, similarities) of the user's n_neighbors nearest neighbours,
+        or None if the table does not cover this user or that many neighbours.
+        '''
+        if user_index >= len(self.neighbors) or n_neighbors > self.n_neighbors:
+            return None
+        neighbors = self.neighbors[user_index, :n_neighbors]
+        valid = neighbors >= 0
+        return neighbors[valid], self.similarities[user_index, :n_neighbors][valid]
+
+
+def load_neighbor_table(user_ids, table_dir=DEFAULT_TABLE_DIR):
+    '''
+    Memory-map the neighbour table, or return None if it is missing or was built for a
+    different set of users (the live path is used in that case).
+    '''
+    try:
+        table_user_ids = np.load(os.path.join(table_dir, 'user_ids.npy'))
+    except FileNotFoundError:
+        print(f"No neighbor table found in '{table_dir}', using live KNN.")
+        return None
+    if not np.array_equal(table_user_ids, np.asarray(user_ids)):
+        print(f"Neighbor table in '{table_dir}' is out of date, using live KNN.")
+        return None
+    return NeighborTable(
+        np.load(os.path.join(table_dir, 'neighbors.npy'), mmap_mode='r'),
+        np.load(os.path.join(table_dir, 'similarities.npy'), mmap_mode='r'),
+    )
+
+
+@stage('knn_fit')
+def live_neighbors(user_item_matrix_sparse, cluster_user_indices, user_index, n_neighbors):
+    '''
+    Fit NearestNeighbors on the cluster submatrix and return the row indices and cosine
+    similarities of the user's neighbours, excluding the user itself.
+    '''
+    cluster_user_indices = np.asarray(cluster_user_indices)
+    knn = NearestNeighbors(n_neighbors=min(n_neighbors + 1, len(cluster_user_indices)), metric='cosine', algorithm='brute')
+    knn.fit(user_item_matrix_sparse[cluster_user_indices])
+    distances, indices = knn.kneighbors(user_item_matrix_sparse[user_index])
+    neighbors = cluster_user_indices[indices[0]]
+    keep = neighbors != user_index
+    return neighbors[keep][:n_neighbors], 1 - distances[0][keep][:n_neighbors]
+
+
+def find_similar_users(user_item_matrix_sparse, neighbor_table, cluster_user_indices, user_index, n_neighbors):
+    '''
+    Nearest neighbours of a user within its cluster: a table lookup when the user is
+    covered by the precomputed table, otherwise a live KNN fit on the cluster.
+    '''
+    if neighbor_table is not None:
+        found = neighbor_table.lookup(user_index, n_neighbors)
+        if found is not None:
+            return found
+    return live_neighbors(user_item_matrix_sparse, cluster_user_indices, user_index, n_neighbors)
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from ingest import ORDER_COLUMNS
+from recommender_index import RecommenderIndex
+
+# Bump this whenever the on-disk layout changes
+STORE_VERSION = 1
+
+DEFAULT_CSV_PATH = 'Data/all_orders_subset.csv'
+
+# Narrowest types that hold the Instacart ids; product names are stored as categories
+ORDER_DTYPES = {'user_id': np.int32, 'product_id': np.int32, 'reordered': np.int8, 'cluster': np.int16}
+
+
+def default_store_dir(csv_path):
+    '''
+    The store for "Data/all_orders_subset.csv" lives in "Data/all_orders_subset_store/".
+    '''
+    return os.path.splitext(csv_path)[0] + '_store'
+
+
+def _source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _save(store_dir, name, array):
+    np.save(os.path.join(store_dir, name + '.npy'), np.ascontiguousarray(array))
+
+
+def _load(store_dir, name):
+    return np.load(os.path.join(store_dir, name + '.npy'), mmap_mode='r')
+
+
+def _concat(groups, keys, dtype):
+    '''
+    Flatten {key: array} into (values, indptr) so every group is a slice of one file.
+    '''
+    lengths = [len(groups[key]) for key in keys]
+    values = np.concatenate([np.asarray(groups[key], dtype=dtype) for key in keys]) if keys else np.empty(0, dtype=dtype)
+    return values, np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+
+def convert_orders(csv_path=DEFAULT_CSV_PATH, store_dir=None):
+    '''
+    Convert the order CSV into typed columns plus every prebuilt RecommenderIndex array,
+    all written as .npy files that load_recommender_index memory-maps.
+
+    The manifest is written last, so a store interrupted half-way is never loaded.
+    Returns the store directory.
+    '''
+    store_dir = store_dir or default_store_dir(csv_path)
+    orders = pd.read_csv(csv_path, usecols=ORDER_COLUMNS, dtype={**ORDER_DTYPES, 'product_name': 'category'})
+    os.makedirs(store_dir, exist_ok=True)
+    manifest_path = os.path.join(store_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    # Typed columnar copy of the orders
+    for column, dtype in ORDER_DTYPES.items():
+        _save(store_dir, 'orders_' + column, orders[column].to_numpy(dtype=dtype))
+    product_name_categories = orders['product_name'].cat.categories.tolist()
+    _save(store_dir, 'orders_product_name_codes', orders['product_name'].cat.codes.to_numpy(dtype=np.int32))
+
+    # Reorder counts summed per (user, product) can exceed int8
+    recommender_index = RecommenderIndex.build(orders.assign(reordered=orders['reordered'].astype(np.int32)))
+    name_codes = {name: code for code, name in enumerate(product_name_categories)}
+
+    _save(store_dir, 'user_ids', recommender_index.user_ids)
+    _save(store_dir, 'product_ids', recommender_index.product_ids)
+    _save(store_dir, 'product_name_codes', [name_codes[name] for name in recommender_index.product_names.tolist()])
+    _save(store_dir, 'name_product_ids', [recommender_index.name_to_product_id[name] for name in product_name_categories])
+
+    matrix = recommender_index.user_item_matrix_sparse
+    _save(store_dir, 'matrix_data', matrix.data)
+    _save(store_dir, 'matrix_indices', matrix.indices)
+    _save(store_dir, 'matrix_indptr', matrix.indptr)
+
+    clusters = sorted(recommender_index.cluster_members)
+    _save(store_dir, 'user_clusters', recommender_index.user_clusters)
+    _save(store_dir, 'clusters', np.asarray(clusters, dtype=ORDER_DTYPES['cluster']))
+    for name, groups, dtype in [
+        ('cluster_members', recommender_index.cluster_members, np.int32),
+        ('cluster_popularity', recommender_index.cluster_popularity, ORDER_DTYPES['product_id']),
+        ('cluster_popularity_counts', recommender_index.cluster_popularity_counts, np.int64),
+    ]:
+        values, indptr = _concat(groups, clusters, dtype)
+        _save(store_dir, name, values)
+        _save(store_dir, name + '_indptr', indptr)
+
+    with open(os.path.join(store_dir, 'product_names.json'), 'w', encoding='utf-8') as f:
+        json.dump(product_name_categories, f)
+    manifest = {
+        'version': STORE_VERSION,
+        'source': _source_stamp(csv_path),
+        'n_rows': len(orders),
+        'n_users': len(recommender_index.user_ids),
+        'n_products': len(recommender_index.product_ids),
+        'shape': list(matrix.shape),
+    }
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return store_dir
+
+
+def read_manifest(store_dir):
+    '''
+    The store manifest, or None if the store is missing or unfinished.
+    '''
+    try:
+        with open(os.path.join(store_dir, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def orders_stamp(csv_path=DEFAULT_CSV_PATH, store_dir=None):
+    '''
+    Identify the orders load_recommender_index(csv_path) reads: the size and modification
+    time of the CSV, or the ones recorded in the store manifest when only the store is
+    shipped. None if there is neither.
+    '''
+    if os.path.exists(csv_path):
+        return _source_stamp(csv_path)
+    manifest = read_manifest(store_dir or default_store_dir(csv_path))
+    return manifest['source'] if manifest is not None else None
+
+
+def load_orders(store_dir):
+    '''
+    The typed order columns as a DataFrame over the memory-mapped files.
+    '''
+    with open(os.path.join(store_dir, 'product_names.json'), encoding='utf-8') as f:
+        categories = json.load(f)
+    orders = pd.DataFrame({column: _load(store_dir, 'orders_' + column) for column in ORDER_DTYPES}, copy=False)
+    orders['product_name'] = pd.Categorical.from_codes(_load(store_dir, 'orders_product_name_codes'), categories)
+    return orders[ORDER_COLUMNS]
+
+
+def load_store(store_dir):
+    '''
+    Rebuild the RecommenderIndex from a converted store without parsing any order rows.
+    The matrix and cluster arrays are memory-mapped views; only the id dicts are built.
+    '''
+    manifest = read_manifest(store_dir)
+    with open(os.path.join(store_dir, 'product_names.json'), encoding='utf-8') as f:
+        categories = np.asarray(json.load(f), dtype=object)
+
+    user_item_matrix_sparse = csr_matrix(
+        (_load(store_dir, 'matrix_data'), _load(store_dir, 'matrix_indices'), _load(store_dir, 'matrix_indptr')),
+        shape=tuple(manifest['shape'])
+    )
+
+    clusters = _load(store_dir, 'clusters').tolist()
+    groups = {}
+    for name in ['cluster_members', 'cluster_popularity', 'cluster_popularity_counts']:
+        values, indptr = _load(store_dir, name), _load(store_dir, name + '_indptr')
+        groups[name] = {cluster: values[indptr[i]:indptr[i + 1]] for i, cluster in enumerate(clusters)}
+
+    name_to_product_id = dict(zip(categories.tolist(), _load(store_dir, 'name_product_ids').tolist()))
+
+    return RecommenderIndex(
+        _load(store_dir, 'user_ids'),
+        _load(store_dir, 'product_ids'),
+        categories[_load(store_dir, 'product_name_codes')],
+        user_item_matrix_sparse,
+        _load(store_dir, 'user_clusters'),
+        groups['cluster_members'],
+        groups['cluster_popularity'],
+        groups['cluster_popularity_counts'],
+        name_to_product_id,
+    )
+
+
+def load_recommender_index(csv_path=DEFAULT_CSV_PATH, store_dir=None):
+    '''
+    Load the RecommenderIndex from the converted store, or build it from the CSV if the
+    store is missing, was written by another STORE_VERSION or the CSV has changed since.
+    '''
+    store_dir = store_dir or default_store_dir(csv_path)
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        print(f"No order store found in '{store_dir}', reading '{csv_path}'.")
+    elif manifest.get('version') != STORE_VERSION:
+        print(f"Order store in '{store_dir}' has version {manifest.get('version')}, expected {STORE_VERSION}; reading '{csv_path}'.")
+    elif os.path.exists(csv_path) and manifest['source'] != _source_stamp(csv_path):
+        print(f"Order store in '{store_dir}' is older than '{csv_path}', reading the CSV.")
+    else:
+        return load_store(store_dir)
+    return RecommenderIndex.build(pd.read_csv(csv_path))
@@ -0,0 +1,162 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from recommender_index import select_top_products
+
+DEFAULT_TABLE_DIR = 'Data/recommendations'
+
+# Set in every worker process by _init_worker
+_worker_state = {}
+
+
+def score_users_block(user_item_matrix_sparse, neighbors, similarities, user_indices, top_n):
+    '''
+    Recommend top_n products for a block of users with one sparse product.
+
+    Row b of the weight matrix holds the similarities of user b's neighbours, stored in
+    the neighbour-table order, so the product adds contributions in the same order as
+    RecommenderIndex.rank_new_products and gives identical scores.
+
+    Returns (columns, scores) of shape (len(user_indices), top_n), padded with -1 / 0.
+    '''
+    block_neighbors = np.asarray(neighbors[user_indices])
+    block_similarities = np.asarray(similarities[user_indices], dtype=np.float64)
+    valid = block_neighbors >= 0
+    indptr = np.concatenate([[0], np.cumsum(valid.sum(axis=1))])
+    weights = csr_matrix(
+        (block_similarities[valid], block_neighbors[valid], indptr),
+        shape=(len(user_indices), user_item_matrix_sparse.shape[0])
+    )
+    scores = weights @ user_item_matrix_sparse
+
+    columns = np.full((len(user_indices), top_n), -1, dtype=np.int32)
+    column_scores = np.zeros((len(user_indices), top_n), dtype=np.float32)
+    for row, user_index in enumerate(user_indices):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        owned_row = user_item_matrix_sparse[user_index]
+        top_columns, top_scores = select_top_products(
+            scores.indices[start:end], scores.data[start:end], owned_row.indices[owned_row.data != 0], top_n
+        )
+        columns[row, :len(top_columns)] = top_columns
+        column_scores[row, :len(top_scores)] = top_scores
+    return columns, column_scores
+
+
+def _init_worker(user_item_matrix_sparse, neighbors, similarities):
+    _worker_state.update(
+        user_item_matrix_sparse=user_item_matrix_sparse, neighbors=neighbors, similarities=similarities
+    )
+
+
+def _score_block(user_indices, top_n):
+    return score_users_block(
+        _worker_state['user_item_matrix_sparse'], _worker_state['neighbors'], _worker_state['similarities'],
+        user_indices, top_n
+    )
+
+
+def bulk_recommend(user_item_matrix_sparse, neighbors, similarities, user_indices, top_n, block_size=2048, n_jobs=None):
+    '''
+    Score every user in user_indices, block by block, across a pool of n_jobs processes.
+    Returns (columns, scores) aligned with user_indices.
+    '''
+    user_indices = np.asarray(user_indices)
+    blocks = [user_indices[start:start + block_size] for start in range(0, len(user_indices), block_size)]
+    with ProcessPoolExecutor(
+        max_workers=n_jobs or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(user_item_matrix_sparse, np.asarray(neighbors), np.asarray(similarities)),
+    ) as executor:
+        results = list(executor.map(_score_block, blocks, [top_n] * len(blocks)))
+
+    if not results:
+        return np.empty((0, top_n), dtype=np.int32), np.empty((0, top_n), dtype=np.float32)
+    return np.concatenate([columns for columns, _ in results]), np.concatenate([scores for _, scores in results])
+
+
+def save_recommendation_table(table_dir, user_ids, product_ids, scores, index_user_ids, index_product_ids, orders):
+    '''
+    Write the table sorted by user id so lookups are a binary search, together with the
+    user and product ids of the index it was computed from and the orders_stamp of the
+    orders behind it.
+
+    The manifest is removed first and written last, so a table interrupted half-way is
+    never loaded.
+    '''
+    os.makedirs(table_dir, exist_ok=True)
+    manifest_path = os.path.join(table_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    np.save(os.path.join(table_dir, 'index_user_ids.npy'), np.asarray(index_user_ids))
+    np.save(os.path.join(table_dir, 'index_product_ids.npy'), np.asarray(index_product_ids))
+    order = np.argsort(user_ids, kind='stable')
+    np.save(os.path.join(table_dir, 'user_ids.npy'), np.asarray(user_ids)[order])
+    np.save(os.path.join(table_dir, 'product_ids.npy'), product_ids[order])
+    np.save(os.path.join(table_dir, 'scores.npy'), scores[order])
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'orders': orders}, f, indent=2)
+
+
+class RecommendationTable:
+    """
+    Precomputed top-N products (and scores) per user, written by bulk_recommend.py.
+    """
+
+    def __init__(self, user_ids, product_ids, scores):
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.scores = scores
+
+    @property
+    def top_n(self):
+        return self.product_ids.shape[1]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def lookup(self, user_id, top_n):
+        '''
+        Return (product ids, scores) for the user, or None if the user is not in the
+        table or more products are requested than were precomputed.
+        '''
+        if top_n > self.top_n:
+            return None
+        row = np.searchsorted(self.user_ids, user_id)
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return None
+        product_ids = self.product_ids[row, :top_n]
+        valid = product_ids >= 0
+        return product_ids[valid].tolist(), self.scores[row, :top_n][valid].tolist()
+
+
+def load_recommendation_table(index_user_ids, index_product_ids, orders, table_dir=DEFAULT_TABLE_DIR):
+    '''
+    Memory-map the precomputed recommendations, or return None if there are none or they
+    were computed from other orders (another orders_stamp) or an index with different
+    users or products (every user is then scored live).
+    '''
+    try:
+        with open(os.path.join(table_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        print(f"No recommendation table found in '{table_dir}', scoring every user live.")
+        return None
+    try:
+        table_user_ids = np.load(os.path.join(table_dir, 'index_user_ids.npy'))
+        table_product_ids = np.load(os.path.join(table_dir, 'index_product_ids.npy'))
+    except FileNotFoundError:
+        table_user_ids = table_product_ids = None
+    if (orders is None or manifest.get('orders') != orders
+            or table_user_ids is None or not np.array_equal(table_user_ids, np.asarray(index_user_ids))
+            or not np.array_equal(table_product_ids, np.asarray(index_product_ids))):
+        print(f"Recommendation table in '{table_dir}' is out of date, scoring every user live.")
+        return None
+    return RecommendationTable(
+        np.load(os.path.join(table_dir, 'user_ids.npy'), mmap_mode='r'),
+        np.load(os.path.join(table_dir, 'product_ids.npy'), mmap_mode='r'),
+        np.load(os.path.join(table_dir, 'scores.npy'), mmap_mode='r'),
+    )
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+
+def select_top_products(candidates, candidate_scores, owned, top_n):
+    '''
+    Drop owned and zero-score candidate columns and return the top_n (columns, scores),
+    best first, ties broken by the lower column.
+    '''
+    keep = (candidate_scores > 0) & ~np.isin(candidates, owned)
+    candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+
+    if 0 < top_n < len(candidates):
+        # Keep everything tied with the top_n-th score so tie-breaking stays exact
+        top = np.argpartition(-candidate_scores, top_n - 1)[:top_n]
+        keep = candidate_scores >= candidate_scores[top].min()
+        candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+
+    order = np.lexsort((candidates, -candidate_scores))[:top_n]
+    return candidates[order], candidate_scores[order]
+
+
+class RecommenderIndex:
+    """
+    Lookup structures for the hybrid recommender, built once from all_orders_subset so
+    that a request never scans the order rows.
+
+    Users and products are identified by their row / column in user_item_matrix_sparse
+    (order of first appearance in the dataset, as in the original notebook).
+    """
+
+    def __init__(self, user_ids, product_ids, product_names, user_item_matrix_sparse, user_clusters,
+                 cluster_members, cluster_popularity, cluster_popularity_counts, name_to_product_id,
+                 updated_user_ids=frozenset()):
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.product_names = product_names
+        self.user_item_matrix_sparse = user_item_matrix_sparse
+        self.user_clusters = user_clusters
+        self.cluster_members = cluster_members
+        self.cluster_popularity = cluster_popularity
+        self.cluster_popularity_counts = cluster_popularity_counts
+        self.name_to_product_id = name_to_product_id
+        # Users whose rows changed since the offline tables were built (see ingest.py)
+        self.updated_user_ids = updated_user_ids
+
+        self.user_id_to_index = {user_id: idx for idx, user_id in enumerate(user_ids.tolist())}
+        self.product_id_to_index = {product_id: idx for idx, product_id in enumerate(product_ids.tolist())}
+        self.product_id_to_name = dict(zip(product_ids.tolist(), product_names.tolist()))
+
+    @classmethod
+    def build(cls, all_orders_subset):
+        '''
+        Build every lookup structure in a single pass over the order rows.
+        '''
+        user_codes, user_ids = pd.factorize(all_orders_subset['user_id'])
+        product_codes, product_ids = pd.factorize(all_orders_subset['product_id'])
+        user_ids, product_ids = np.asarray(user_ids), np.asarray(product_ids)
+
+        user_item_matrix_sparse = csr_matrix(
+            (all_orders_subset['reordered'], (user_codes, product_codes)),
+            shape=(len(user_ids), len(product_ids))
+        )
+
+        # Name shown for each product column (first name seen for that product id)
+        first_rows = all_orders_subset.drop_duplicates('product_id')
+        product_names = first_rows.set_index('product_id')['product_name'].reindex(product_ids).to_numpy()
+
+        # A product name resolves to the first product id it appears with
+        names = all_orders_subset[['product_name', 'product_id']].drop_duplicates('product_name')
+        name_to_product_id = dict(zip(names['product_name'], names['product_id']))
+
+        # Cluster of every user, taken from its first order row
+        user_clusters = all_orders_subset.groupby(user_codes, sort=True)['cluster'].first().to_numpy()
+
+        clusters = all_orders_subset['cluster'].to_numpy()
+        cluster_members = {}
+        cluster_popularity = {}
+        cluster_popularity_counts = {}
+        for cluster in np.unique(clusters):
+            in_cluster = clusters == cluster
+            # Users of the cluster in order of first appearance
+            cluster_members[cluster] = pd.unique(user_codes[in_cluster]).astype(np.int32)
+            # Products of the cluster, most ordered first (same order as value_counts())
+            counts = all_orders_subset['product_id'][in_cluster].value_counts()
+            cluster_popularity[cluster] = counts.index.to_numpy()
+            cluster_popularity_counts[cluster] = counts.to_numpy()
+
+        return cls(user_ids, product_ids, product_names, user_item_matrix_sparse, user_clusters,
+                   cluster_members, cluster_popularity, cluster_popularity_counts, name_to_product_id)
+
+    def user_index(self, user_id):
+        return self.user_id_to_index.get(user_id)
+
+    def cluster_of(self, user_index):
+        return self.user_clusters[user_index]
+
+    def resolve_product_names(self, product_names):
+        '''
+        Map product names to product ids, returning (product_ids, unknown_names).
+        '''
+        product_ids, unknown = [], []
+        for name in product_names:
+            product_id = self.name_to_product_id.get(name)
+            if product_id is None:
+                unknown.append(name)
+            else:
+                product_ids.append(product_id)
+        return product_ids, unknown
+
+    def owned_products(self, user_index):
+        '''
+        Columns of the products the user has a non-zero entry for.
+        '''
+        row = self.user_item_matrix_sparse[user_index]
+        return row.indices[row.data != 0]
+
+    def rank_new_products(self, user_index, similar_user_indices, similarities, top_n):
+        '''
+        Rank the products bought by the neighbours but not by the user.
+
+        Each neighbour's reorder row is weighted by its similarity and summed, products
+        the user already has are masked out, and the top_n are picked with argpartition.
+        Returns (product ids, scores), best first, ties broken by the lower column so the
+        output is deterministic.
+        '''
+        weights = csr_matrix(np.asarray(similarities, dtype=np.float64).reshape(1, -1))
+        scores = weights @ self.user_item_matrix_sparse[similar_user_indices]
+
+        columns, column_scores = select_top_products(scores.indices, scores.data, self.owned_products(user_index), top_n)
+        return self.product_ids[columns], column_scores
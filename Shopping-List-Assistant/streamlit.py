@@ -1,100 +1,67 @@
 import streamlit as st
-import pandas as pd
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-import numpy as np
 
-# Load the dataset
-@st.cache_data  # Cache the dataset for faster loading
-def load_data():
-    return pd.read_csv('Data/all_orders_subset.csv')
+import order_store
+from neighbors import find_similar_users, load_neighbor_table
 
-all_orders_subset = load_data()
+@st.cache_resource  # Load the matrix and lookup structures once, not on every rerun
+def load_recommender_index():
+    # Memory-mapped store written by convert_orders.py (falls back to the CSV)
+    return order_store.load_recommender_index('Data/all_orders_subset.csv')
 
-# Extract unique product_id and product_name mapping
-product_id_to_name = all_orders_subset[['product_id', 'product_name']].drop_duplicates().set_index('product_id')['product_name']
+@st.cache_resource  # Check and memory-map the table once, not on every rerun
+def load_cached_neighbor_table():
+    # Within-cluster neighbours precomputed by build_neighbors.py (None -> live KNN only)
+    return load_neighbor_table(load_recommender_index().user_ids)
 
-# Create the user-item matrix
-unique_users = all_orders_subset['user_id'].unique()
-unique_products = all_orders_subset['product_id'].unique()
+recommender_index = load_recommender_index()
+neighbor_table = load_cached_neighbor_table()
 
-# Create mappings from user_id and product_id to integer indices
-user_id_to_index = {user_id: idx for idx, user_id in enumerate(unique_users)}
-product_id_to_index = {product_id: idx for idx, product_id in enumerate(unique_products)}
-
-# Map user_id and product_id to their respective indices
-row_indices = all_orders_subset['user_id'].map(user_id_to_index)
-col_indices = all_orders_subset['product_id'].map(product_id_to_index)
-
-# Create the sparse user-item matrix
-user_item_matrix_sparse = csr_matrix(
-    (all_orders_subset['reordered'], (row_indices, col_indices)),
-    shape=(len(unique_users), len(unique_products))
-)
-
-def recommend_products_hybrid(user_id, product_names, all_orders_subset, user_item_matrix_sparse, product_id_to_name, user_id_to_index, top_n=5):
+def recommend_products_hybrid(user_id, product_names, recommender_index, top_n=5, neighbor_table=None):
     """
     Recommends products for a given user using a hybrid approach.
     """
+    user_item_matrix_sparse = recommender_index.user_item_matrix_sparse
+    product_id_to_name = recommender_index.product_id_to_name
+
     # Step 1: Map product names to product IDs
-    product_ids = []
-    for name in product_names:
-        product_id = all_orders_subset[all_orders_subset['product_name'] == name]['product_id'].values
-        if len(product_id) > 0:
-            product_ids.append(product_id[0])
-        else:
-            st.warning(f"Product '{name}' not found in the dataset.")
+    product_ids, unknown_names = recommender_index.resolve_product_names(product_names)
+    for name in unknown_names:
+        st.warning(f"Product '{name}' not found in the dataset.")
     
     if not product_ids:
         st.error("No valid products found. Please check your input.")
         return []
     
     # Step 2: Check if the user exists in the subset
-    if user_id not in user_id_to_index:
+    user_index = recommender_index.user_index(user_id)
+    if user_index is None:
         st.error(f"User ID {user_id} not found in the subset.")
         return []
     
     # Step 3: Get the cluster of the target user
-    target_user_cluster = all_orders_subset[all_orders_subset['user_id'] == user_id]['cluster'].values[0]
+    target_user_cluster = recommender_index.cluster_of(user_index)
     st.write(f"Target user belongs to cluster: {target_user_cluster}")
     
-    # Step 4: Filter the dataset to include only users in the same cluster
-    cluster_users = all_orders_subset[all_orders_subset['cluster'] == target_user_cluster]['user_id'].unique()
-    
-    # Filter the user-item matrix to include only users in the same cluster
-    cluster_user_indices = [user_id_to_index[user] for user in cluster_users if user in user_id_to_index]
-    cluster_user_item_matrix = user_item_matrix_sparse[cluster_user_indices]
+    # Step 4: Users in the same cluster (matrix row indices)
+    cluster_user_indices = recommender_index.cluster_members[target_user_cluster]
     
-    # Step 5: Find similar users within the cluster using KNN
-    knn = NearestNeighbors(n_neighbors=10, metric='cosine', algorithm='brute')  # Find 10 most similar users
-    knn.fit(cluster_user_item_matrix)
-    
-    # Find similar users for the target user
-    user_index = user_id_to_index[user_id]
-    distances, indices = knn.kneighbors(user_item_matrix_sparse[user_index])
-    similar_users = [cluster_users[idx] for idx in indices[0][1:]]  # Exclude the user itself
-    
-    # Step 6: Get products purchased by similar users but not by the target user
-    similar_user_indices = [user_id_to_index[user] for user in similar_users]
-    similar_user_products = user_item_matrix_sparse[similar_user_indices].sum(axis=0)  # Sum across similar users
-    target_user_products = user_item_matrix_sparse[user_index].nonzero()[1]  # Products purchased by the target user
-    
-    # Find new products
-    new_products = set(similar_user_products.nonzero()[1]) - set(target_user_products)
-    
-    # Step 7: Get top N recommended products from similar users
-    recommended_products = list(new_products)[:top_n]
+    # Step 5: Find similar users within the cluster (precomputed table, or live KNN for users it does not cover)
+    similar_user_indices, similarities = find_similar_users(
+        user_item_matrix_sparse, neighbor_table, cluster_user_indices, user_index, n_neighbors=9
+    )
     
-    # Filter out invalid product IDs
-    valid_recommended_products = [product_id for product_id in recommended_products if product_id in product_id_to_name]
+    # Step 6-7: Rank products bought by similar users (weighted by similarity) but not by the target user
+    recommended_products, _ = recommender_index.rank_new_products(user_index, similar_user_indices, similarities, top_n)
+    valid_recommended_products = recommended_products.tolist()
     
     # Step 8: If not enough recommendations, fall back to top popular products in the cluster
     if len(valid_recommended_products) < top_n:
-        cluster_products = all_orders_subset[all_orders_subset['cluster'] == target_user_cluster]['product_id'].value_counts().index.tolist()
+        cluster_products = recommender_index.cluster_popularity[target_user_cluster]
         
         # Exclude products already purchased by the target user
-        popular_products = [product_id for product_id in cluster_products 
-                            if product_id in product_id_to_name and product_id not in target_user_products]
+        target_user_products = set(recommender_index.product_ids[recommender_index.owned_products(user_index)].tolist())
+        popular_products = [product_id for product_id in cluster_products.tolist()
+                            if product_id not in target_user_products]
         
         # Add only the required number of popular products
         required = top_n - len(valid_recommended_products)
@@ -142,10 +109,8 @@ if st.button("Get Recommendations"):
     recommendations = recommend_products_hybrid(
         user_id=user_id,
         product_names=product_names,
-        all_orders_subset=all_orders_subset,
-        user_item_matrix_sparse=user_item_matrix_sparse,
-        product_id_to_name=product_id_to_name,
-        user_id_to_index=user_id_to_index,
+        recommender_index=recommender_index,
+        neighbor_table=neighbor_table,
         top_n=top_n  # Use the slider value
     )
     
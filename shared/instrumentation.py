@@ -0,0 +1,413 @@
+"""
+Stage timers, counters and histograms in the Prometheus text format, plus a sampling
+profiler that can be switched on and off at runtime.
+
+Shared by the services, which install it from this directory (`../shared` in their
+requirements.txt).
+It only needs the standard library; the web frameworks are used through the app object.
+
+The /debug/profiler routes are off unless PROFILER_TOKEN is set, and then require that
+token in the X-Profiler-Token header.
+"""
+import bisect
+import collections
+import hmac
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Shortest sampling interval accepted; smaller ones would keep a core busy walking stacks
+MIN_PROFILER_INTERVAL = 0.001
+
+PROFILER_TOKEN_HEADER = 'X-Profiler-Token'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. With `function`, the value is read at scrape time
+    (only for gauges without labels).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, function=None):
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.function is not None:
+            self.set(self.function())
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram('stage_duration_seconds', 'Time spent in each instrumented stage.', ['stage'])
+STAGE_ERRORS = Counter('stage_errors_total', 'Instrumented stages that raised an exception.', ['stage'])
+EVENTS = Counter('events_total', 'Named events, such as cache hits and fallbacks.', ['event'])
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency.', ['method', 'route', 'status'])
+
+_started = time.time()
+Gauge('process_uptime_seconds', 'Seconds since the service started.', function=lambda: time.time() - _started)
+
+
+def _resident_memory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+Gauge('process_resident_memory_bytes', 'Resident memory of the service.', function=_resident_memory)
+
+
+class stage:
+    """
+    Time a block or a function into stage_duration_seconds{stage=name}:
+
+        with stage('vectorize'):
+            ...
+
+        @stage('knn_fit')
+        def live_neighbors(...):
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.elapsed = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._start
+        STAGE_SECONDS.observe(self.elapsed, stage=self.name)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.name)
+        return False
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(self.name):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def count(event, amount=1):
+    EVENTS.inc(amount, event=event)
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each `interval` seconds from a background thread
+    and counts identical stacks. report() returns them in the folded format read by
+    flamegraph.pl and speedscope ("frame;frame;frame count").
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = max(interval, MIN_PROFILER_INTERVAL)
+        self.max_depth = max_depth
+        self.samples = collections.Counter()
+        self.n_samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _sample(self):
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            stacks.append(';'.join(reversed(stack)))
+        with self._lock:
+            self.samples.update(stacks)
+            self.n_samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self, interval=None):
+        if self._thread is not None:
+            return
+        if interval:
+            self.interval = max(interval, MIN_PROFILER_INTERVAL)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.n_samples = 0
+
+    def report(self, limit=None):
+        with self._lock:
+            stacks = self.samples.most_common(limit)
+        return ''.join(f'{stack} {n}\n' for stack, n in stacks)
+
+    def status(self):
+        return {'running': self.running, 'interval': self.interval, 'samples': self.n_samples, 'stacks': len(self.samples)}
+
+
+profiler = SamplingProfiler()
+if os.getenv('PROFILER') == '1':
+    profiler.start(float(os.getenv('PROFILER_INTERVAL', profiler.interval)))
+
+
+def toggle_profiler(action, interval=None):
+    '''
+    'start', 'stop' or 'reset' the profiler; returns its status.
+    '''
+    if action == 'start':
+        profiler.start(interval)
+    elif action == 'stop':
+        profiler.stop()
+    elif action == 'reset':
+        profiler.reset()
+    else:
+        raise ValueError(f"Unknown profiler action '{action}'")
+    return profiler.status()
+
+
+def profiler_access(token):
+    '''
+    None if a request carrying `token` may use the /debug/profiler routes, otherwise
+    (status code, message): 404 while PROFILER_TOKEN is unset, 403 for a wrong token.
+    '''
+    expected = os.getenv('PROFILER_TOKEN')
+    if not expected:
+        return 404, 'Not Found'
+    if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+        return 403, 'Forbidden'
+    return None
+
+
+def instrument_flask(app):
+    '''
+    Time every request and add GET /metrics, GET /debug/profiler (folded stacks) and
+    POST /debug/profiler/<start|stop|reset>?interval=seconds to a Flask app. The
+    profiler routes follow profiler_access.
+    '''
+    from flask import Response, g, jsonify, request
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = getattr(g, '_request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+    @app.route('/debug/profiler', methods=['GET'])
+    def profiler_report():
+        denied = profiler_access(request.headers.get(PROFILER_TOKEN_HEADER))
+        if denied is not None:
+            return jsonify({'error': denied[1]}), denied[0]
+        limit = request.args.get('limit', type=int)
+        return Response(profiler.report(limit), mimetype='text/plain')
+
+    @app.route('/debug/profiler/<action>', methods=['POST'])
+    def profiler_toggle(action):
+        denied = profiler_access(request.headers.get(PROFILER_TOKEN_HEADER))
+        if denied is not None:
+            return jsonify({'error': denied[1]}), denied[0]
+        try:
+            return jsonify(toggle_profiler(action, request.args.get('interval', type=float)))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    return app
+
+
+def instrument_fastapi(app):
+    '''
+    The FastAPI counterpart of instrument_flask.
+    '''
+    from fastapi import Header, HTTPException, Request
+    from fastapi.responses import PlainTextResponse
+
+    @app.middleware('http')
+    async def _observe_request(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get('route')
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                route=route.path if route is not None else 'unmatched', status=response.status_code)
+        return response
+
+    @app.get('/metrics', response_class=PlainTextResponse)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+    def check_access(token):
+        denied = profiler_access(token)
+        if denied is not None:
+            raise HTTPException(status_code=denied[0], detail=denied[1])
+
+    @app.get('/debug/profiler', response_class=PlainTextResponse)
+    def profiler_report(limit: int = None, x_profiler_token: str = Header(None)):
+        check_access(x_profiler_token)
+        return profiler.report(limit)
+
+    @app.post('/debug/profiler/{action}')
+    def profiler_toggle(action: str, interval: float = None, x_profiler_token: str = Header(None)):
+        check_access(x_profiler_token)
+        try:
+            return toggle_profiler(action, interval)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return app